@@ -1,8 +1,9 @@
 import os
 import sys
 import sqlite3
+import zlib
 from pathlib import Path
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, session, flash, jsonify
 from flask_session import Session
 from dotenv import load_dotenv
 
@@ -131,35 +132,107 @@ def dashboard():
         return redirect(url_for("login"))
     return render_template("dashboard.html", user=user)
 
+MUSIC_PAGE_SIZE = 12
+
 @app.route("/music")
 def music_page():
     user = current_user()
     q = request.args.get("q", "")
-    results = []
+    index = max(request.args.get("index", 0, type=int), 0)
+    results, next_index = [], None
     if q:
-        results = music.search_tracks(q)
-    return render_template("music.html", user=user, query=q, results=results)
+        results, next_index = music.search_tracks_page(q, index, MUSIC_PAGE_SIZE)
+        if next_index is not None:
+            # Have the next page in the cache by the time "Load more" is clicked
+            music.prefetch_tracks_page(q, next_index, MUSIC_PAGE_SIZE)
+    if request.args.get("partial"):
+        # "Load more": just the new cards (and the next button) to append to the page
+        return render_template("_music_tracks.html", query=q, results=results, next_index=next_index)
+    return render_template("music.html", user=user, query=q, results=results, next_index=next_index)
 
 @app.route("/videos")
 def videos_page():
     user = current_user()
     q = request.args.get("q", "")
+    country = request.args.get("country", "")
+    category = request.args.get("category", "")
+    cursor = request.args.get("cursor") or None
     watch_id = request.args.get("watch")
 
-    # Get the catalog of movies (optionally filtered by search query)
-    results = videos.search_videos(q)
+    # Get a page of the catalog (optionally filtered by search query, country and category)
+    try:
+        page = videos.search_videos_page(q, country=country or None, category=category or None, cursor=cursor)
+    except ValueError:
+        cursor = None
+        page = videos.search_videos_page(q, country=country or None, category=category or None)
+    results = page["results"]
+
+    # No exact matches: fall back to typo-tolerant search, best matches first
+    fuzzy = False
+    if q and not results and not cursor:
+        results = videos.search_videos(q, 24, country=country or None, category=category or None, fuzzy=True)
+        fuzzy = bool(results)
 
-    # Choose the movie to play
+    # Choose the movie to play (deep links resolve any channel by id, not just this page)
     selected = None
     if watch_id:
-        selected = next((m for m in results if m["id"] == watch_id), None)
+        selected = videos.get_channel(watch_id)
+        if not selected:
+            flash("That channel is not available right now", "info")
     if not selected and results:
         selected = results[0]
 
     return render_template(
-        "videos.html", user=user, query=q, results=results, selected=selected
+        "videos.html",
+        user=user,
+        query=q,
+        country=country,
+        category=category,
+        countries=videos.get_available_countries(min_count=1),
+        categories=videos.get_available_categories(min_count=1),
+        cursor=cursor,
+        total=page["total"],
+        next_cursor=page["next_cursor"],
+        fuzzy=fuzzy,
+        related=videos.related_channels(selected["id"], 10) if selected else [],
+        results=results,
+        selected=selected,
     )
 
+@app.route("/api/videos/autocomplete")
+def videos_autocomplete():
+    """JSON channel-name suggestions for the search box (?q=prefix&k=8)."""
+    q = request.args.get("q", "")
+    k = min(max(request.args.get("k", 8, type=int), 1), 25)
+    return jsonify({"query": q, "suggestions": videos.autocomplete_channels(q, k)})
+
+def gzip_chunks(chunks):
+    """Compress an iterable of byte chunks into a streamed gzip body."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route("/api/videos/playlist.<fmt>")
+def videos_playlist(fmt):
+    """Stream an M3U playlist of the channels matching ?q=&country=&category=."""
+    if fmt not in ("m3u", "m3u8"):
+        abort(404)
+    q = request.args.get("q", "")
+    country = request.args.get("country", "")
+    category = request.args.get("category", "")
+
+    # Generated while the response is sent; the playlist is never held in memory
+    chunks = (chunk.encode("utf-8") for chunk in videos.iter_m3u(q, country or None, category or None))
+    headers = {"Content-Disposition": f'attachment; filename="channels.{fmt}"', "Vary": "Accept-Encoding"}
+    if request.accept_encodings["gzip"]:
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    mimetype = "application/vnd.apple.mpegurl" if fmt == "m3u8" else "audio/x-mpegurl"
+    return Response(chunks, mimetype=mimetype, headers=headers)
+
 @app.route("/games")
 def games_page():
     user = current_user()
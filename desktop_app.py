@@ -2,6 +2,7 @@ import sys
 import os
 from pathlib import Path
 import webbrowser
+from itertools import islice
 
 from PyQt5 import QtCore, QtGui, QtWidgets, QtMultimedia
 try:
@@ -304,6 +305,8 @@ class AuthWindow(QtWidgets.QWidget):
 class MusicPage(QtWidgets.QWidget):
     """Spotify-like page with full media controls, navigation, and large display."""
 
+    PAGE_SIZE = 25  # Tracks per "Load more"
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setStyleSheet("background-color: #121212;")
@@ -313,6 +316,7 @@ class MusicPage(QtWidgets.QWidget):
         self.current_track = None
         self.track_list = []  # Store all tracks for navigation
         self.current_index = -1
+        self._track_iter = None  # Lazy pages of the current search (music.iter_tracks)
         
         # Connect player signals
         self.player.positionChanged.connect(self.update_progress)
@@ -484,6 +488,26 @@ class MusicPage(QtWidgets.QWidget):
         self.track_list_widget.itemClicked.connect(self._on_track_selected)
         scroll_area.setWidget(self.track_list_widget)
         layout.addWidget(scroll_area, 1)
+
+        # Load more button (takes the next page of the current search, already prefetched)
+        self.load_more_btn = QtWidgets.QPushButton("Load more tracks")
+        self.load_more_btn.setCursor(QtCore.Qt.PointingHandCursor)
+        self.load_more_btn.setStyleSheet("""
+            QPushButton {
+                background-color: rgba(255, 255, 255, 0.1);
+                color: #ffffff;
+                border-radius: 12px;
+                padding: 12px 24px;
+                font-size: 14px;
+                font-weight: 600;
+            }
+            QPushButton:hover {
+                background-color: rgba(255, 255, 255, 0.2);
+            }
+        """)
+        self.load_more_btn.clicked.connect(self.load_more_tracks)
+        self.load_more_btn.hide()
+        layout.addWidget(self.load_more_btn, 0, QtCore.Qt.AlignHCenter)
         
         return page
     
@@ -705,11 +729,23 @@ class MusicPage(QtWidgets.QWidget):
         query = self.search_edit.text().strip()
         self.track_list_widget.clear()
         self.track_list.clear()
+        self.load_more_btn.hide()
+        self._track_iter = None
         if not query:
             return
         
-        tracks = music.search_tracks(query)
-        self.track_list = tracks
+        # Pages are fetched lazily; the next one loads in the background meanwhile
+        self._track_iter = music.iter_tracks(query, page_size=self.PAGE_SIZE)
+        self.load_more_tracks()
+
+    def load_more_tracks(self):
+        """Append the next page of the current search to the track list."""
+        if self._track_iter is None:
+            return
+        tracks = list(islice(self._track_iter, self.PAGE_SIZE))
+        self.track_list.extend(tracks)
+        # A short page means the results are exhausted
+        self.load_more_btn.setVisible(len(tracks) == self.PAGE_SIZE)
         
         for t in tracks:
             # Create custom item widget for better display
@@ -882,6 +918,8 @@ class MusicPage(QtWidgets.QWidget):
 class VideosPage(QtWidgets.QWidget):
     """Netflix-style grid of posters with embedded video player."""
 
+    PAGE_SIZE = 48  # Channels per page in the grid
+
     def __init__(self, parent=None):
         super().__init__(parent)
         
@@ -932,6 +970,15 @@ class VideosPage(QtWidgets.QWidget):
         """)
         self.search_edit.returnPressed.connect(self.refresh_grid)
         
+        # Channel name suggestions while typing (prefix index, no full search per keystroke)
+        self._suggestions_model = QtCore.QStringListModel(self)
+        completer = QtWidgets.QCompleter(self._suggestions_model, self)
+        completer.setCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        completer.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
+        completer.activated.connect(lambda _text: self.refresh_grid())
+        self.search_edit.setCompleter(completer)
+        self.search_edit.textEdited.connect(self._update_suggestions)
+        
         # Country filter
         country_label = QtWidgets.QLabel("Country:")
         country_label.setStyleSheet("font-size: 14px; color: #b3b3b3; padding: 0 8px;")
@@ -1038,6 +1085,26 @@ class VideosPage(QtWidgets.QWidget):
         scroll_area.setWidget(self.grid_widget)
         grid_layout.addWidget(scroll_area, 1)
 
+        # Load more button (fetches the next page of the current search)
+        self.load_more_btn = QtWidgets.QPushButton("Load more channels")
+        self.load_more_btn.setCursor(QtCore.Qt.PointingHandCursor)
+        self.load_more_btn.setStyleSheet("""
+            QPushButton {
+                background-color: rgba(255, 255, 255, 0.1);
+                color: #ffffff;
+                border-radius: 12px;
+                padding: 12px 24px;
+                font-size: 14px;
+                font-weight: 600;
+            }
+            QPushButton:hover {
+                background-color: rgba(255, 255, 255, 0.2);
+            }
+        """)
+        self.load_more_btn.clicked.connect(self.load_more)
+        self.load_more_btn.hide()
+        grid_layout.addWidget(self.load_more_btn, 0, QtCore.Qt.AlignHCenter)
+
         self.stack.addWidget(self.grid_page)
         
         # Video player page
@@ -1046,6 +1113,8 @@ class VideosPage(QtWidgets.QWidget):
         
         self.current_movie = None
         self.all_channels = []  # Store all channels for discovery
+        self._next_cursor = None  # Cursor for the next page of the current search
+        self._total_channels = 0
         # Load channels on startup (empty query shows all)
         try:
             self.refresh_grid()
@@ -1056,19 +1125,25 @@ class VideosPage(QtWidgets.QWidget):
     def _load_filter_options(self):
         """Load country and category options for filters."""
         try:
-            # Load countries
-            countries = videos.get_available_countries()
-            for country in countries:  # Show all countries
-                display_text = f"{country['name']} ({country['code']})"
+            # Load countries that have playable channels
+            countries = videos.get_available_countries(min_count=1)
+            for country in countries:
+                display_text = f"{country['name']} ({country['code']}) · {country['count']}"
                 self.country_combo.addItem(display_text, country['code'])
             
-            # Load categories
-            categories = videos.get_available_categories()
+            # Load categories, most popular first
+            category_counts = videos.get_category_counts()
+            categories = videos.get_available_categories(min_count=1, by_popularity=True)
             for category in categories:
-                self.category_combo.addItem(category.capitalize(), category.lower())
+                self.category_combo.addItem(f"{category.capitalize()} · {category_counts[category]}", category.lower())
         except Exception as e:
             print(f"[VideosPage] Failed to load filter options: {e}")
 
+    def _update_suggestions(self, text: str):
+        """Refresh the completer with channel names starting with the typed text."""
+        suggestions = videos.autocomplete_channels(text, 8) if text.strip() else []
+        self._suggestions_model.setStringList([s["title"] for s in suggestions])
+
     def refresh_grid(self):
         # Clear old widgets
         while self.grid_layout.count():
@@ -1092,14 +1167,29 @@ class VideosPage(QtWidgets.QWidget):
             status_parts.append(f"category: {category}")
         self.status_label.setText(" ".join(status_parts) + "...")
         
-        # Load more channels for better display (increase max_results)
-        movie_list = videos.search_videos(
+        # Load the first page; "Load more" fetches the rest page by page
+        page = videos.search_videos_page(
             query=query,
-            max_results=50,
             country=country if country else None,
-            category=category if category else None
+            category=category if category else None,
+            page_size=self.PAGE_SIZE,
         )
-        self.all_channels = movie_list
+        movie_list = page["results"]
+        fuzzy = False
+        if query and not movie_list:
+            # No exact matches: fall back to typo-tolerant search, best matches first
+            movie_list = videos.search_videos(
+                query=query,
+                max_results=self.PAGE_SIZE,
+                country=country if country else None,
+                category=category if category else None,
+                fuzzy=True,
+            )
+            fuzzy = bool(movie_list)
+        self.all_channels = list(movie_list)
+        self._next_cursor = page["next_cursor"]
+        self._total_channels = page["total"] if not fuzzy else len(movie_list)
+        self.load_more_btn.setVisible(self._next_cursor is not None)
 
         if not movie_list:
             # Show message if no results
@@ -1122,9 +1212,44 @@ class VideosPage(QtWidgets.QWidget):
                 self.status_label.setText("No channels found")
             return
 
+        self._add_movie_cards(movie_list, 0)
+        if fuzzy:
+            self.status_label.setText(f"No exact matches for '{query}' — showing the closest channel names")
+        else:
+            self._update_grid_status()
+
+    def load_more(self):
+        """Append the next page of the current search to the grid."""
+        if not self._next_cursor:
+            return
+        query = self.search_edit.text().strip()
+        country = self.country_combo.currentData()
+        category = self.category_combo.currentData()
+        try:
+            page = videos.search_videos_page(
+                query=query,
+                country=country if country else None,
+                category=category if category else None,
+                cursor=self._next_cursor,
+                page_size=self.PAGE_SIZE,
+            )
+        except ValueError as e:
+            print(f"[VideosPage] Could not load next page: {e}")
+            self.load_more_btn.hide()
+            return
+
+        start = len(self.all_channels)
+        self.all_channels.extend(page["results"])
+        self._next_cursor = page["next_cursor"]
+        self.load_more_btn.setVisible(self._next_cursor is not None)
+        self._add_movie_cards(page["results"], start)
+        self._update_grid_status()
+
+    def _add_movie_cards(self, movie_list: list, start: int):
+        """Add channel cards to the grid, continuing from grid index `start`."""
         # Use 4 columns for larger display
         cols = 4
-        for idx, movie in enumerate(movie_list):
+        for idx, movie in enumerate(movie_list, start):
             r, c = divmod(idx, cols)
             card = self._create_movie_card(movie)
             self.grid_layout.addWidget(card, r, c)
@@ -1132,13 +1257,15 @@ class VideosPage(QtWidgets.QWidget):
         # Add stretch to make grid fill available space symmetrically
         for i in range(cols):
             self.grid_layout.setColumnStretch(i, 1)
-        
-        # Update status
-        channel_text = "channel" if len(movie_list) == 1 else "channels"
+
+    def _update_grid_status(self):
+        query = self.search_edit.text().strip()
+        shown = len(self.all_channels)
+        channel_text = "channel" if self._total_channels == 1 else "channels"
         if query:
-            self.status_label.setText(f"Showing {len(movie_list)} {channel_text} matching '{query}'")
+            self.status_label.setText(f"Showing {shown} of {self._total_channels} {channel_text} matching '{query}'")
         else:
-            self.status_label.setText(f"Showing {len(movie_list)} {channel_text}")
+            self.status_label.setText(f"Showing {shown} of {self._total_channels} {channel_text}")
 
     def _create_player_page(self) -> QtWidgets.QWidget:
         """Create the video player page with navigation and discovery elements."""
@@ -1546,21 +1673,11 @@ class VideosPage(QtWidgets.QWidget):
             if w is not None:
                 w.deleteLater()
         
-        # Get current channel country/language for related channels
-        current_country = current_channel.get("description", "").lower()
-        
-        # Show up to 10 related channels (excluding current)
-        related_count = 0
-        for channel in self.all_channels:
-            if related_count >= 10:
-                break
-            if channel.get("id") == current_channel.get("id"):
-                continue
-            
+        # Show up to 10 related channels (same country, shared categories, similar names)
+        for channel in videos.related_channels(current_channel.get("id", ""), 10):
             # Create smaller card for related channels
             card = self._create_related_channel_card(channel)
             self.related_layout.addWidget(card)
-            related_count += 1
         
         self.related_layout.addStretch()
 
@@ -0,0 +1,150 @@
+"""
+Small in-process caches shared by the media modules.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """Thread-safe bounded LRU cache with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value (marking it most recently used) or None."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entry if full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+
+class TTLCache:
+    """
+    Thread-safe bounded cache for stale-while-revalidate.
+
+    An entry is fresh for `ttl` seconds, then stale for another `stale_ttl`
+    seconds (still returned, so the caller can serve it and refresh it in the
+    background), then gone. When full, the least recently used entry is
+    evicted. Values whose `sizeof` exceeds `max_entry_size` are not stored.
+    """
+
+    FRESH = "fresh"
+    STALE = "stale"
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float = 300,
+        stale_ttl: float = 3600,
+        max_entry_size: Optional[int] = None,
+        sizeof: Callable[[Any], int] = len,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entry_size = max_entry_size
+        self.sizeof = sizeof
+        self.clock = clock
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.oversized = 0
+        # key -> (value, stored_at)
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[Optional[Any], Optional[str]]:
+        """
+        Look a key up.
+
+        Returns:
+            (value, TTLCache.FRESH or TTLCache.STALE), or (None, None) if the key
+            is missing or expired.
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._data.get(key)
+            age = None if entry is None else now - entry[1]
+            if age is None or age > self.ttl + self.stale_ttl:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None, None
+            self._data.move_to_end(key)
+            if age <= self.ttl:
+                self.hits += 1
+                return entry[0], self.FRESH
+            self.stale_hits += 1
+            return entry[0], self.STALE
+
+    def put(self, key: Hashable, value: Any) -> bool:
+        """Store (or renew) a value; returns False if it was too big to cache."""
+        if self.maxsize <= 0:
+            return False
+        if self.max_entry_size is not None and self.sizeof(value) > self.max_entry_size:
+            with self._lock:
+                self.oversized += 1
+            return False
+        with self._lock:
+            self._data[key] = (value, self.clock())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "oversized": self.oversized,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
@@ -0,0 +1,497 @@
+"""
+Binary catalog file shared read-only between worker processes.
+
+One process builds the Catalog as usual and writes its records and indexes
+to `catalog.bin` next to the feed snapshots. Every worker then `mmap`s the
+file and searches it in place: strings, posting lists and position arrays
+are read through memoryviews, so nothing is deserialized per process and
+the pages are shared by the OS page cache. Boot is an mmap plus a small
+JSON header, and adding workers does not add catalog copies.
+
+Layout (native byte order, sections 8-byte aligned):
+
+    MAGIC | section ... | header JSON | <u64 header offset, u64 header length> | MAGIC
+
+The header lists every section's offset and size, the small lookup tables
+(countries, counts) and the feed validators the file was built from.
+"""
+import contextlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .video_index import (
+    Catalog,
+    ChannelRecord,
+    FacetIndex,
+    PrefixIndex,
+    StreamRecord,
+    TokenIndex,
+    TrigramIndex,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds aren't serialized, the atomic rename still is
+    fcntl = None
+
+MAGIC = b"IPTVCAT1"
+FORMAT_VERSION = 1
+_TRAILER = struct.Struct("<QQ")
+_ALIGN = 8
+# uint32 columns per channel row
+_ID, _NAME, _LOGO, _COUNTRY, _CATS, _NCATS, _ALTS, _NALTS, _STREAMS, _NSTREAMS = range(10)
+_ROW = 10
+
+
+class _Writer:
+    """Appends aligned sections to a file and returns their descriptors."""
+
+    def __init__(self, f: BinaryIO):
+        self._f = f
+        self._offset = 0
+        self._write(MAGIC)
+
+    def _write(self, payload: bytes) -> int:
+        offset = self._offset
+        self._f.write(payload)
+        self._offset += len(payload)
+        return offset
+
+    def raw(self, payload: bytes) -> List[int]:
+        self._write(b"\0" * (-self._offset % _ALIGN))
+        return [self._write(payload), len(payload)]
+
+    def numbers(self, typecode: str, values) -> List[int]:
+        return self.raw(array(typecode, values).tobytes())
+
+    def strings(self, values: Sequence[str]) -> Dict[str, List[int]]:
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = array("I", [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        return {"offsets": self.raw(offsets.tobytes()), "blob": self.raw(b"".join(encoded))}
+
+    def lists(self, values: Sequence[Sequence[int]]) -> Dict[str, List[int]]:
+        offsets = array("I", [0])
+        flat = array("I")
+        for value in values:
+            flat.extend(value)
+            offsets.append(len(flat))
+        return {"offsets": self.raw(offsets.tobytes()), "values": self.raw(flat.tobytes())}
+
+    def finish(self, header: Dict) -> int:
+        payload = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        offset = self._write(payload)
+        self._write(_TRAILER.pack(offset, len(payload)))
+        self._write(MAGIC)
+        return self._offset
+
+
+class _MappedStrings:
+    """Sequence of strings decoded on access from an offsets array and a UTF-8 blob."""
+
+    __slots__ = ("_offsets", "_blob")
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], "utf-8")
+
+
+class _MappedLists:
+    """Sequence of uint32 lists; each item is a zero-copy memoryview slice."""
+
+    __slots__ = ("_offsets", "_values")
+
+    def __init__(self, offsets: memoryview, values: memoryview):
+        self._offsets = offsets
+        self._values = values
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> memoryview:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._values[self._offsets[i]:self._offsets[i + 1]]
+
+
+class _MappedLookup:
+    """Read-only dict-like lookup: sorted string keys, binary searched."""
+
+    __slots__ = ("_keys", "_values")
+
+    def __init__(self, keys: _MappedStrings, values: Sequence):
+        self._keys = keys
+        self._values = values
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, key: str, default=None):
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._values[i]
+        return default
+
+
+class _MappedFlags:
+    """Set-like view of the positions whose flag byte is 1."""
+
+    __slots__ = ("_flags", "_count")
+
+    def __init__(self, flags: memoryview, count: int):
+        self._flags = flags
+        self._count = count
+
+    def __contains__(self, pos) -> bool:
+        return isinstance(pos, int) and 0 <= pos < len(self._flags) and self._flags[pos] == 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[int]:
+        return (pos for pos, flag in enumerate(self._flags) if flag)
+
+
+class _MappedChannels:
+    """Sequence of ChannelRecords built on access from fixed-width rows."""
+
+    __slots__ = ("_rows", "_strings", "_refs")
+
+    def __init__(self, rows: memoryview, strings: _MappedStrings, refs: memoryview):
+        self._rows = rows
+        self._strings = strings
+        self._refs = refs
+
+    def __len__(self) -> int:
+        return len(self._rows) // _ROW
+
+    def row(self, pos: int) -> memoryview:
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError(pos)
+        return self._rows[pos * _ROW:(pos + 1) * _ROW]
+
+    def name(self, pos: int) -> str:
+        return self._strings[self.row(pos)[_NAME]]
+
+    def _tuple(self, start: int, count: int) -> Tuple[str, ...]:
+        return tuple(self._strings[ref] for ref in self._refs[start:start + count])
+
+    def __getitem__(self, pos: int) -> ChannelRecord:
+        row = self.row(pos)
+        strings = self._strings
+        return ChannelRecord(
+            strings[row[_ID]],
+            strings[row[_NAME]],
+            sys.intern(strings[row[_COUNTRY]]),
+            tuple(sys.intern(c) for c in self._tuple(row[_CATS], row[_NCATS])),
+            strings[row[_LOGO]],
+            self._tuple(row[_ALTS], row[_NALTS]),
+        )
+
+
+class _MappedStreams:
+    """channel id -> [StreamRecord], read from the stream rows of the channel's position."""
+
+    __slots__ = ("_channels", "_positions", "_rows", "_strings")
+
+    def __init__(self, channels: _MappedChannels, positions: _MappedLookup, rows: memoryview, strings: _MappedStrings):
+        self._channels = channels
+        self._positions = positions
+        self._rows = rows
+        self._strings = strings
+
+    def get(self, channel_id: str, default=None) -> Optional[List[StreamRecord]]:
+        pos = self._positions.get(channel_id)
+        if pos is None:
+            return default
+        row = self._channels.row(pos)
+        start, count = row[_STREAMS], row[_NSTREAMS]
+        if not count:
+            return default
+        strings = self._strings
+        return [
+            StreamRecord(channel_id, strings[self._rows[i]], sys.intern(strings[self._rows[i + 1]]))
+            for i in range(2 * start, 2 * (start + count), 2)
+        ]
+
+    def __getitem__(self, channel_id: str) -> List[StreamRecord]:
+        streams = self.get(channel_id)
+        if streams is None:
+            raise KeyError(channel_id)
+        return streams
+
+    def __contains__(self, channel_id: str) -> bool:
+        return self.get(channel_id) is not None
+
+
+def write_catalog(path: Path, catalog: Catalog, sources: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Write a built catalog to `path` (atomically: temp file + rename).
+
+    Args:
+        sources: Feed validators the catalog was built from; open_catalog
+            refuses the file when the snapshots have moved on since
+
+    Returns:
+        Size of the file in bytes.
+    """
+    string_ids: Dict[str, int] = {}
+    strings: List[str] = []
+
+    def ref(value: str) -> int:
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = string_ids[value] = len(strings)
+            strings.append(value)
+        return string_id
+
+    rows = array("I")
+    refs = array("I")
+    stream_rows = array("I")
+    for channel in catalog.channels:
+        categories_at = len(refs)
+        refs.extend(ref(category) for category in channel.categories)
+        alts_at = len(refs)
+        refs.extend(ref(name) for name in channel.alt_names)
+        streams_at = len(stream_rows) // 2
+        streams = catalog.streams_map.get(channel.id) or ()
+        for stream in streams:
+            stream_rows.append(ref(stream.url))
+            stream_rows.append(ref(stream.quality))
+        rows.extend((
+            ref(channel.id), ref(channel.name), ref(channel.logo), ref(channel.country),
+            categories_at, len(channel.categories), alts_at, len(channel.alt_names),
+            streams_at, len(streams),
+        ))
+
+    playable = bytearray(len(catalog.channels))
+    for pos in catalog.playable:
+        playable[pos] = 1
+    ids = sorted(catalog.positions_by_id.items())
+    tokens, facets, trigrams, prefixes = catalog.tokens, catalog.facets, catalog.trigrams, catalog.prefixes
+    grams = sorted(trigrams._postings.items())
+    by_country = sorted(facets._by_country.items())
+    by_category = sorted(facets._by_category.items())
+
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        writer = _Writer(f)
+        sections = {
+            "strings": writer.strings(strings),
+            "rows": writer.numbers("I", rows),
+            "refs": writer.numbers("I", refs),
+            "stream_rows": writer.numbers("I", stream_rows),
+            "playable": writer.raw(bytes(playable)),
+            "id_keys": writer.strings([channel_id for channel_id, _ in ids]),
+            "id_positions": writer.numbers("I", (pos for _, pos in ids)),
+            "tokens": writer.strings(tokens._tokens),
+            "token_postings": writer.lists(tokens._postings),
+            "suffixes": writer.strings(tokens._suffixes),
+            "suffix_tokens": writer.numbers("I", tokens._suffix_tokens),
+            "country_keys": writer.strings([code for code, _ in by_country]),
+            "country_postings": writer.lists([positions for _, positions in by_country]),
+            "category_keys": writer.strings([category for category, _ in by_category]),
+            "category_postings": writer.lists([positions for _, positions in by_category]),
+            "gram_keys": writer.strings([gram for gram, _ in grams]),
+            "gram_postings": writer.lists([postings for _, postings in grams]),
+            "string_channel": writer.numbers("I", trigrams._string_channel),
+            "string_size": writer.numbers("H", trigrams._string_size),
+            "prefix_name_keys": writer.strings(prefixes._name_keys),
+            "prefix_name_positions": writer.numbers("I", prefixes._name_positions),
+            "prefix_word_keys": writer.strings(prefixes._word_keys),
+            "prefix_word_positions": writer.numbers("I", prefixes._word_positions),
+        }
+        header = {
+            "format": FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "sources": sources or {},
+            "countries": catalog.countries,
+            "country_counts": catalog.country_counts,
+            "category_counts": catalog.category_counts,
+            "playable_count": len(catalog.playable),
+            "dead_strings": sorted(trigrams._dead),
+            "sections": sections,
+        }
+        size = writer.finish(header)
+    os.replace(tmp_path, path)
+    return size
+
+
+class MappedCatalog(Catalog):
+    """
+    A Catalog whose records and indexes are read from a memory-mapped catalog file.
+
+    It exposes the same attributes as an in-memory Catalog, backed by the
+    same index classes over memoryviews, so search code can't tell them
+    apart. Mapped catalogs can't be patched; a refresh writes a new file.
+    """
+
+    def __init__(self, path: Path, version: int):
+        # Deliberately not calling Catalog.__init__: everything comes from the file
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        view = memoryview(self._mmap)
+
+        if view[:len(MAGIC)] != MAGIC or view[-len(MAGIC):] != MAGIC:
+            raise ValueError(f"{self.path} is not a catalog file")
+        trailer_at = len(view) - len(MAGIC) - _TRAILER.size
+        header_at, header_size = _TRAILER.unpack(view[trailer_at:trailer_at + _TRAILER.size])
+        header = json.loads(bytes(view[header_at:header_at + header_size]))
+        if header.get("format") != FORMAT_VERSION or header.get("byteorder") != sys.byteorder:
+            raise ValueError(f"{self.path} has an unsupported catalog format")
+        sections = header["sections"]
+        self.sources: Dict[str, Any] = header["sources"]
+
+        def raw(name: str) -> memoryview:
+            offset, size = sections[name]
+            return view[offset:offset + size]
+
+        def numbers(name: str, typecode: str = "I") -> memoryview:
+            return raw(name).cast(typecode)
+
+        def strings(name: str) -> _MappedStrings:
+            desc = sections[name]
+            return _MappedStrings(_slice(view, desc["offsets"]).cast("I"), _slice(view, desc["blob"]))
+
+        def lists(name: str) -> _MappedLists:
+            desc = sections[name]
+            return _MappedLists(_slice(view, desc["offsets"]).cast("I"), _slice(view, desc["values"]).cast("I"))
+
+        self.version = version
+        self.countries: Dict[str, str] = header["countries"]
+        self.country_counts: Dict[str, int] = header["country_counts"]
+        self.category_counts: Dict[str, int] = header["category_counts"]
+        self.channels = _MappedChannels(numbers("rows"), strings("strings"), numbers("refs"))
+        self.positions_by_id = _MappedLookup(strings("id_keys"), numbers("id_positions"))
+        self.streams_map = _MappedStreams(self.channels, self.positions_by_id, numbers("stream_rows"), strings("strings"))
+        self.playable = _MappedFlags(raw("playable"), header["playable_count"])
+        self._patchable = False
+        self._related: Dict[int, List[int]] = {}
+
+        # The index classes over mapped arrays instead of lists
+        tokens = TokenIndex.__new__(TokenIndex)
+        tokens._tokens = strings("tokens")
+        tokens._postings = lists("token_postings")
+        tokens._suffixes = strings("suffixes")
+        tokens._suffix_tokens = numbers("suffix_tokens")
+        tokens._empty = 0  # mapped catalogs are never patched
+        self.tokens = tokens
+
+        facets = FacetIndex.__new__(FacetIndex)
+        facets._by_country = _small_dict(strings("country_keys"), lists("country_postings"))
+        facets._by_category = _small_dict(strings("category_keys"), lists("category_postings"))
+        facets._set_country_keys(self.countries)
+        self.facets = facets
+
+        trigrams = TrigramIndex.__new__(TrigramIndex)
+        trigrams._postings = _MappedLookup(strings("gram_keys"), lists("gram_postings"))
+        trigrams._string_channel = numbers("string_channel")
+        trigrams._string_size = numbers("string_size", "H")
+        trigrams._dead = set(header["dead_strings"])
+        self.trigrams = trigrams
+
+        prefixes = PrefixIndex.__new__(PrefixIndex)
+        prefixes._name_keys = strings("prefix_name_keys")
+        prefixes._name_positions = numbers("prefix_name_positions")
+        prefixes._word_keys = strings("prefix_word_keys")
+        prefixes._word_positions = numbers("prefix_word_positions")
+        self.prefixes = prefixes
+
+        self._set_vocabularies()
+
+    def channel_name(self, pos: int) -> str:
+        return self.channels.name(pos)
+
+
+def _slice(view: memoryview, desc: List[int]) -> memoryview:
+    offset, size = desc
+    return view[offset:offset + size]
+
+
+def _small_dict(keys: _MappedStrings, values: _MappedLists) -> Dict[str, memoryview]:
+    """Facet keys are few (countries, categories); a real dict keeps lookups plain."""
+    return {keys[i]: values[i] for i in range(len(keys))}
+
+
+def file_id(path: Path) -> Optional[Tuple[int, int, int]]:
+    """(inode, mtime, size) of the catalog file, to notice when it was replaced; None if missing."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def open_catalog(path: Path, version: int, sources: Optional[Dict[str, Any]] = None) -> Optional[MappedCatalog]:
+    """
+    Map a catalog file.
+
+    Args:
+        version: Version number the process assigns to this catalog
+        sources: If given, the file must have been built from these feed validators
+
+    Returns:
+        The mapped catalog, or None if the file is missing, unreadable or stale.
+    """
+    try:
+        catalog = MappedCatalog(path, version)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"[catalog_file.open_catalog] Ignoring {path}: {exc}")
+        return None
+    if sources is not None and catalog.sources != sources:
+        return None
+    return catalog
+
+
+@contextlib.contextmanager
+def build_lock(path: Path) -> Iterator[None]:
+    """
+    Hold an exclusive lock on `<path>.lock` so only one process builds the file.
+
+    Without fcntl (Windows) or a writable directory this is a no-op.
+    """
+    lock_file = None
+    if fcntl is not None:
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            lock_file = open(f"{path}.lock", "a+b")
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        except OSError as exc:
+            print(f"[catalog_file.build_lock] Building without a lock: {exc}")
+            if lock_file is not None:
+                lock_file.close()
+            lock_file = None
+    try:
+        yield
+    finally:
+        if lock_file is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
@@ -0,0 +1,170 @@
+"""
+On-disk snapshot store for the IPTV catalog feeds.
+
+Each feed is kept as the raw JSON body (`<name>.json`) plus a small metadata
+file (`<name>.meta.json`) holding the ETag/Last-Modified validators. A new
+process can serve the snapshot straight away and revalidate it against the
+API with a conditional GET in the background.
+"""
+import io
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple
+
+import requests
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+# Override with IPTV_SNAPSHOT_DIR (e.g. /tmp/iptv on read-only deployments like Vercel)
+SNAPSHOT_DIR = Path(os.environ.get("IPTV_SNAPSHOT_DIR", PROJECT_ROOT / ".iptv_snapshot"))
+# Skip the conditional GET if the snapshot was validated this recently (seconds)
+REVALIDATE_AFTER = int(os.environ.get("IPTV_REVALIDATE_AFTER", "600"))
+
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+
+
+def _data_path(name: str) -> Path:
+    return SNAPSHOT_DIR / f"{name}.json"
+
+
+def _meta_path(name: str) -> Path:
+    return SNAPSHOT_DIR / f"{name}.meta.json"
+
+
+def write_atomic(path: Path, payload: bytes) -> None:
+    """Write to a temp file and rename, so readers never see a partial file."""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def read_meta(name: str) -> Dict:
+    """Return the stored validators for a feed, or an empty dict."""
+    try:
+        with open(_meta_path(name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def read_snapshot(name: str, parse: Callable[[BinaryIO], Any] = json.load) -> Optional[Tuple[Any, Dict]]:
+    """
+    Load a feed snapshot from disk.
+
+    Args:
+        parse: Turns the open (binary) snapshot file into data; the default
+            decodes the whole JSON document
+
+    Returns:
+        (parsed data, metadata dict) or None if there is no usable snapshot.
+    """
+    try:
+        with open(_data_path(name), "rb") as f:
+            data = parse(f)
+    except (OSError, ValueError):
+        return None
+    return data, read_meta(name)
+
+
+def write_snapshot(name: str, body: bytes, etag: Optional[str], last_modified: Optional[str]) -> None:
+    """Persist a raw feed body and its validators. Failures are logged, not raised."""
+    meta = {
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched_at": time.time(),
+        "checked_at": time.time(),
+    }
+    try:
+        SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        write_atomic(_data_path(name), body)
+        write_atomic(_meta_path(name), json.dumps(meta).encode("utf-8"))
+    except OSError as exc:
+        print(f"[catalog_store.write_snapshot] Could not save {name} snapshot: {exc}")
+
+
+def _touch_meta(name: str, meta: Dict) -> None:
+    """Record a successful revalidation (304) without rewriting the body."""
+    meta = dict(meta, checked_at=time.time())
+    try:
+        write_atomic(_meta_path(name), json.dumps(meta).encode("utf-8"))
+    except OSError as exc:
+        print(f"[catalog_store._touch_meta] Could not update {name} metadata: {exc}")
+
+
+def fetch(
+    name: str,
+    url: str,
+    meta: Optional[Dict] = None,
+    timeout: int = 30,
+    parse: Callable[[BinaryIO], Any] = json.load,
+) -> Optional[Any]:
+    """
+    Download a feed, conditionally if `meta` holds validators.
+
+    Args:
+        parse: Turns the response body (as a binary file) into data, as for read_snapshot
+
+    Returns:
+        Parsed JSON on 200 (the snapshot is rewritten), None on 304.
+
+    Raises:
+        requests.RequestException / ValueError on network or parse errors.
+    """
+    headers = {}
+    if meta:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    r = requests.get(url, headers=headers, timeout=timeout)
+    if r.status_code == 304 and meta:
+        _touch_meta(name, meta)
+        return None
+    r.raise_for_status()
+    data = parse(io.BytesIO(r.content))
+    write_snapshot(name, r.content, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+    return data
+
+
+def needs_revalidation(meta: Dict) -> bool:
+    """True if the snapshot has not been checked within REVALIDATE_AFTER seconds."""
+    return time.time() - meta.get("checked_at", 0) >= REVALIDATE_AFTER
+
+
+def revalidate_async(
+    name: str,
+    url: str,
+    meta: Dict,
+    on_change: Callable[[Any], None],
+    parse: Callable[[BinaryIO], Any] = json.load,
+) -> None:
+    """
+    Revalidate a snapshot in a daemon thread.
+
+    `on_change` is called with the new data (as returned by `parse`) only if the feed changed.
+    At most one revalidation per feed runs at a time in this process.
+    """
+    with _revalidating_lock:
+        if name in _revalidating:
+            return
+        _revalidating.add(name)
+
+    def worker():
+        try:
+            data = fetch(name, url, meta, parse=parse)
+            if data is not None:
+                print(f"[catalog_store.revalidate] {name} changed upstream, reloading")
+                on_change(data)
+        except Exception as exc:
+            print(f"[catalog_store.revalidate] Could not revalidate {name}: {exc}")
+        finally:
+            with _revalidating_lock:
+                _revalidating.discard(name)
+
+    threading.Thread(target=worker, name=f"revalidate-{name}", daemon=True).start()
@@ -1,12 +1,237 @@
-from typing import List, Dict
+"""
+Music module: search tracks with the public Deezer API.
+
+All calls go through one DeezerClient that owns a pooled keep-alive
+requests.Session, so a search reuses an open TLS connection to
+api.deezer.com instead of paying a fresh handshake every time.
+
+Search results are cached with stale-while-revalidate: a fresh entry is
+served as is, a stale one is served immediately while a background thread
+fetches the new results, so a slow Deezer only delays cold queries.
+Concurrent identical searches share one in-flight Deezer call.
+
+Results are paged with Deezer's `index`/`next`: every page is cached on its
+own, so "load more" only ever asks Deezer for the page after the last one
+shown, and iter_tracks walks all pages lazily, fetching the next page in the
+background while the current one is consumed.
+
+Every track Deezer returns is also kept in a local SQLite FTS5 index
+(track_index), which answers repeat searches before Deezer is asked at all.
+Paged results (the /music page, the desktop app) stay in Deezer's order: a
+page is only answered locally from what Deezer returned for that same query.
+Prefix matching over all stored tracks answers search_tracks only, which
+returns a single page to callers of this module.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Iterator, List, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from . import track_index
+from .cache import TTLCache
+from .singleflight import SingleFlight
+
+DEEZER_API_URL = "https://api.deezer.com"
+# Seconds to wait for Deezer before giving up on a search
+DEEZER_TIMEOUT = float(os.environ.get("MUSIC_DEEZER_TIMEOUT", "5"))
+# Keep-alive connections kept open per host; concurrent calls beyond this wait for a free one
+DEEZER_POOL_SIZE = int(os.environ.get("MUSIC_POOL_SIZE", "8"))
+# Number of searches kept in the result cache (0 disables it)
+SEARCH_CACHE_SIZE = int(os.environ.get("MUSIC_CACHE_SIZE", "256"))
+# Seconds a cached search is served as is, then how much longer it may be served while refreshing
+SEARCH_CACHE_TTL = float(os.environ.get("MUSIC_CACHE_TTL", "300"))
+SEARCH_CACHE_STALE_TTL = float(os.environ.get("MUSIC_CACHE_STALE_TTL", "3600"))
+# Searches returning more tracks than this are not cached
+SEARCH_CACHE_MAX_TRACKS = int(os.environ.get("MUSIC_CACHE_MAX_TRACKS", "100"))
+# Threads fetching upcoming result pages in the background
+PREFETCH_WORKERS = int(os.environ.get("MUSIC_PREFETCH_WORKERS", "4"))
+# Answer searches from the local track index when it can, falling back to Deezer
+LOCAL_INDEX = os.environ.get("MUSIC_LOCAL_INDEX", "1") == "1"
+
+_client = None
+_client_lock = threading.Lock()
+# (normalized query, limit, index, related) -> (tuple of track dicts, index of the next page or None);
+# `related` pages (search_tracks) may come from any stored track, so they are kept apart from paged ones
+_search_cache = TTLCache(
+    SEARCH_CACHE_SIZE,
+    SEARCH_CACHE_TTL,
+    SEARCH_CACHE_STALE_TTL,
+    SEARCH_CACHE_MAX_TRACKS,
+    sizeof=lambda page: len(page[0]),
+)
+# Keys with a background refresh running, so a stale entry is refreshed once
+_refreshing = set()
+_refresh_lock = threading.Lock()
+_refresh_stats = {"refreshes": 0, "refresh_errors": 0}
+# Concurrent searches for the same page share one upstream call
+_searches = SingleFlight()
+_prefetch_pool = ThreadPoolExecutor(max_workers=max(PREFETCH_WORKERS, 1), thread_name_prefix="music-prefetch")
+
+
+def _track_from_item(item: Dict) -> Dict:
+    """Shape one Deezer track object for the music template."""
+    artist = item.get("artist") or {}
+    album = item.get("album") or {}
+    return {
+        "id": item.get("id"),
+        "name": item.get("title"),
+        "artists": artist.get("name", ""),
+        "album": album.get("title", ""),
+        "image": album.get("cover_medium") or album.get("cover"),
+        "preview_url": item.get("preview"),  # 30s MP3
+        "external_url": item.get("link"),
+    }
+
+
+class DeezerClient:
+    """Deezer API client over a pooled keep-alive session, safe to share between threads."""
+
+    def __init__(self, base_url: str = DEEZER_API_URL, pool_size: int = DEEZER_POOL_SIZE,
+                 timeout: float = DEEZER_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Accept": "application/json"})
+        # One pool per host, at most `pool_size` connections each; pool_block makes
+        # extra callers wait for a connection rather than open throwaway ones
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(pool_size, 1), pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path: str, params: Optional[Dict] = None) -> Any:
+        """
+        GET a Deezer API path and return the decoded JSON.
+
+        Raises:
+            requests.RequestException / ValueError on network, HTTP or API errors
+            (Deezer reports some errors as a 200 with an "error" object).
+        """
+        resp = self.session.get(f"{self.base_url}/{path.lstrip('/')}", params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        if isinstance(data, dict) and data.get("error"):
+            raise ValueError(f"Deezer error: {data['error']}")
+        return data
+
+    def search_page(self, query: str, index: int = 0, limit: int = 25) -> Tuple[List[Dict], Optional[int]]:
+        """
+        Fetch one page of track search results. Raises on errors.
+
+        Returns:
+            (tracks shaped like search_tracks' results, index of the next page or
+            None if this is the last one)
+        """
+        data = self.get("search", {"q": query, "index": index, "limit": limit})
+        items = data.get("data", []) or []
+        next_index = None
+        if data.get("next") and items:
+            # Deezer's `next` is a URL carrying the next index; fall back to counting
+            next_params = parse_qs(urlsplit(data["next"]).query)
+            try:
+                next_index = int(next_params["index"][0])
+            except (KeyError, ValueError):
+                next_index = index + len(items)
+        return [_track_from_item(item) for item in items], next_index
+
+    def search_tracks(self, query: str, limit: int = 12) -> List[Dict]:
+        """Search tracks; same result shape as the module-level search_tracks. Raises on errors."""
+        return self.search_page(query, 0, limit)[0]
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def get_client() -> DeezerClient:
+    """The process-wide Deezer client, shared by the web routes and the desktop app."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DeezerClient()
+    return _client
+
+
+def _cache_key(query: str, limit: int, index: int = 0, related: bool = False) -> Tuple[str, int, int, bool]:
+    # Deezer search ignores case and extra spaces
+    return " ".join(query.lower().split()), limit, index, related
+
+
+def _fetch_and_cache(key: Tuple[str, int, int, bool], query: str, limit: int, index: int = 0,
+                     local: bool = True, related: bool = False) -> Tuple[List[Dict], Optional[int]]:
+    """
+    Get one result page (from the local track index if `local` and it can
+    answer, else from Deezer) and cache it; raises on errors (failures are
+    never cached). Only `related` pages may be answered from tracks stored
+    for other queries.
+
+    Callers asking for the same key while a call is in flight wait for it and
+    get the same list, so copy it before handing it out.
+    """
+    def fetch():
+        page = None
+        if LOCAL_INDEX and local:
+            page = track_index.search_page(query, index, limit)
+            if page is None and related:
+                tracks = track_index.search_related(query, limit)
+                page = (tracks, None) if tracks is not None else None
+        if page is None:
+            page = get_client().search_page(query, index, limit)
+            if LOCAL_INDEX:
+                track_index.add_tracks(query, index, *page)
+        tracks, next_index = page
+        _search_cache.put(key, (tuple(dict(track) for track in tracks), next_index))
+        return tracks, next_index
+
+    # Waiters give up a little after the leader's own request would have timed out
+    return _searches.do(key, fetch, timeout=2 * DEEZER_TIMEOUT)
+
+
+def _refresh_async(key: Tuple[str, int, int, bool], query: str, limit: int, index: int = 0,
+                   related: bool = False) -> None:
+    """Refresh a stale cache entry in a daemon thread, unless that is already happening."""
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def worker():
+        outcome = "refresh_errors"
+        try:
+            # Straight to Deezer: this is how the local index learns about new results
+            _fetch_and_cache(key, query, limit, index, local=False, related=related)
+            outcome = "refreshes"
+        except Exception as exc:
+            # Keep serving the stale entry until it expires
+            print(f"[music._refresh_async] Refresh of {query!r} failed: {exc}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+                _refresh_stats[outcome] += 1
+
+    threading.Thread(target=worker, daemon=True).start()
+
+
+def get_search_cache_stats() -> Dict[str, int]:
+    """Hit (fresh and stale)/miss/eviction counters and size of the search cache, plus refresh and local index counts."""
+    stats = _search_cache.stats()
+    with _refresh_lock:
+        stats.update(_refresh_stats, refreshing=len(_refreshing))
+    stats["in_flight"] = _searches.in_flight()
+    if LOCAL_INDEX:
+        stats.update(track_index.stats())
+    return stats
 
 
 def search_tracks(query: str, limit: int = 12) -> List[Dict]:
     """
     Search tracks using the public Deezer API.
 
+    Results are served from the search cache when possible (see module docstring).
+
     Returns a list of dicts shaped for the music template:
     - id: Deezer track id
     - name: track title
@@ -17,32 +242,75 @@ def search_tracks(query: str, limit: int = 12) -> List[Dict]:
     - external_url: link to open track on Deezer
     """
     try:
-        resp = requests.get(
-            "https://api.deezer.com/search",
-            params={"q": query, "limit": limit},
-            timeout=5,
-        )
-        resp.raise_for_status()
-        data = resp.json()
+        # A single page, so tracks stored for related queries may answer it
+        return _search_page(query, 0, limit, related=True)[0]
     except Exception as exc:
         print(f"[music.search_tracks] Deezer search failed: {exc}")
         return []
 
-    items = data.get("data", []) or []
-    tracks: List[Dict] = []
-    for item in items:
-        artist = item.get("artist") or {}
-        album = item.get("album") or {}
-        tracks.append(
-            {
-                "id": item.get("id"),
-                "name": item.get("title"),
-                "artists": artist.get("name", ""),
-                "album": album.get("title", ""),
-                "image": album.get("cover_medium") or album.get("cover"),
-                "preview_url": item.get("preview"),  # 30s MP3
-                "external_url": item.get("link"),
-            }
-        )
-
-    return tracks
\ No newline at end of file
+
+def _search_page(query: str, index: int, limit: int, related: bool = False) -> Tuple[List[Dict], Optional[int]]:
+    """One result page through the cache and the in-flight dedup; raises on errors."""
+    key = _cache_key(query, limit, index, related)
+    cached, state = _search_cache.get(key)
+    if cached is None:
+        cached = _fetch_and_cache(key, query, limit, index, related=related)
+    elif state == TTLCache.STALE:
+        _refresh_async(key, query, limit, index, related)
+    tracks, next_index = cached
+    # Copies, so callers can't change the cached tracks
+    return [dict(track) for track in tracks], next_index
+
+
+def search_tracks_page(query: str, index: int = 0, limit: int = 12) -> Tuple[List[Dict], Optional[int]]:
+    """
+    Get one page of search results, starting at result `index`.
+
+    Returns:
+        (tracks shaped as for search_tracks, index of the next page or None if
+        there is none). A failed search gives ([], None).
+    """
+    try:
+        return _search_page(query, index, limit)
+    except Exception as exc:
+        print(f"[music.search_tracks_page] Deezer search failed: {exc}")
+        return [], None
+
+
+def prefetch_tracks_page(query: str, index: int, limit: int = 12) -> Future:
+    """Fetch a result page into the cache in the background; the future holds search_tracks_page's result."""
+    return _prefetch_pool.submit(search_tracks_page, query, index, limit)
+
+
+def iter_tracks(query: str, page_size: int = 25, index: int = 0, prefetch: bool = True) -> Iterator[Dict]:
+    """
+    Lazily yield every track matching `query`, page by page.
+
+    Nothing is requested until the first track is asked for. While a page is
+    being consumed, the next one is already fetched in the background (unless
+    `prefetch` is False), so walking the results rarely waits on Deezer.
+    Stops at the last page, or early if a page fails to load. A track already
+    yielded is skipped (Deezer's pages can overlap when its results shift).
+
+    Args:
+        query: Search text
+        page_size: Tracks per Deezer request
+        index: Result index to start from
+        prefetch: Fetch the next page while the current one is consumed
+    """
+    seen = set()
+    tracks, next_index = search_tracks_page(query, index, page_size)
+    while tracks:
+        upcoming = None
+        if prefetch and next_index is not None:
+            upcoming = prefetch_tracks_page(query, next_index, page_size)
+        for track in tracks:
+            if track["id"] not in seen:
+                seen.add(track["id"])
+                yield track
+        if next_index is None:
+            return
+        if upcoming is not None:
+            tracks, next_index = upcoming.result()
+        else:
+            tracks, next_index = search_tracks_page(query, next_index, page_size)
@@ -0,0 +1,70 @@
+"""
+Single-flight call deduplication.
+
+When several threads ask for the same thing at once (the same feed, the same
+search), only the first one does the work; the others wait for it and get
+the same result, or the same exception.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome with concurrent callers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Call `fn()` unless a call for `key` is already in flight, then wait for that one.
+
+        Args:
+            key: Identifies the work; concurrent calls with an equal key are merged
+            fn: The work to do if this caller is first
+            timeout: Max seconds to wait for someone else's call (None = no limit)
+
+        Returns:
+            The result of the (shared) call.
+
+        Raises:
+            TimeoutError: If waiting for an in-flight call took longer than `timeout`.
+            Whatever `fn` raised, for the caller that ran it and every waiter.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as exc:
+                call.error = exc
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            raise TimeoutError(f"Timed out after {timeout}s waiting for in-flight {key!r}")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self) -> int:
+        """Number of keys currently being worked on."""
+        with self._lock:
+            return len(self._calls)
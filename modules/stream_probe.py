@@ -0,0 +1,200 @@
+"""
+Stream health prober: checks IPTV stream URLs and remembers which are alive.
+
+Probes run concurrently with a global cap and a per-host cap (many streams
+share a CDN host, and hammering one host gets us rate limited). Results are
+kept in memory and persisted to `stream_health.json` next to the catalog
+snapshots, so other workers and later processes can reuse them. Workers
+merge into that file rather than overwrite it, and pick up each other's
+results whenever they save.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from . import catalog_file, catalog_store
+
+PROBE_TIMEOUT = float(os.environ.get("IPTV_PROBE_TIMEOUT", "5"))
+PROBE_WORKERS = int(os.environ.get("IPTV_PROBE_WORKERS", "16"))
+PROBE_PER_HOST = int(os.environ.get("IPTV_PROBE_PER_HOST", "2"))
+# Re-probe a URL once its last result is older than this (seconds)
+PROBE_TTL = int(os.environ.get("IPTV_PROBE_TTL", "3600"))
+# While a sweep runs, write the results gathered so far to disk at most this often (seconds)
+_SAVE_INTERVAL = 5.0
+
+_health: Optional[Dict[str, Dict]] = None
+_health_lock = threading.Lock()
+_probe_thread: Optional[threading.Thread] = None
+
+
+def _store_path():
+    return catalog_store.SNAPSHOT_DIR / "stream_health.json"
+
+
+def _read_saved_health() -> Dict[str, Dict]:
+    try:
+        with open(_store_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _load_health() -> Dict[str, Dict]:
+    """Return the url -> health dict, loading it from disk on first use."""
+    global _health
+    if _health is None:
+        with _health_lock:
+            if _health is None:
+                _health = _read_saved_health()
+    return _health
+
+
+def _save_health() -> None:
+    """
+    Merge the results in memory with the saved ones and write them back.
+
+    The file is re-read under its lock, so results other workers saved since
+    this process loaded it are kept (and adopted here); for a URL probed by
+    several workers, the latest probe wins.
+    """
+    health = _load_health()
+    try:
+        catalog_store.SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        with catalog_file.build_lock(_store_path()):
+            saved = _read_saved_health()
+            with _health_lock:
+                for url, result in saved.items():
+                    current = health.get(url)
+                    if current is None or current.get("checked_at", 0) < result.get("checked_at", 0):
+                        health[url] = result
+                payload = json.dumps(health).encode("utf-8")
+            catalog_store.write_atomic(_store_path(), payload)
+    except OSError as exc:
+        print(f"[stream_probe._save_health] Could not save stream health: {exc}")
+
+
+def get_health(url: str) -> Optional[Dict]:
+    """Last probe result for a URL: {"alive", "latency", "checked_at"} or None."""
+    return _load_health().get(url)
+
+
+def probe_url(url: str, timeout: float = PROBE_TIMEOUT) -> Dict:
+    """
+    Probe a single stream URL.
+
+    A stream is alive if the server answers with a non-error status; latency
+    is the time until the response headers arrived (seconds).
+    """
+    started = time.perf_counter()
+    try:
+        with requests.get(url, stream=True, timeout=timeout) as r:
+            alive = r.status_code < 400
+    except requests.RequestException:
+        alive = False
+    latency = time.perf_counter() - started
+    return {"alive": alive, "latency": round(latency, 4) if alive else None, "checked_at": time.time()}
+
+
+def probe_urls(
+    urls: Iterable[str],
+    max_workers: int = PROBE_WORKERS,
+    per_host: int = PROBE_PER_HOST,
+    timeout: float = PROBE_TIMEOUT,
+) -> Dict[str, Dict]:
+    """
+    Probe URLs concurrently and record the results.
+
+    At most `max_workers` probes run at once, and at most `per_host` of them
+    against the same host. URLs are queued per host and a probe is only
+    handed to the pool when its host has a free slot, so streams clustered
+    on one host never leave workers idle waiting for it. Each result is
+    recorded as soon as it arrives (and saved every few seconds), so stream
+    choice improves during a long sweep and an interrupted sweep keeps what
+    it found.
+
+    Returns:
+        dict url -> probe result for the URLs probed in this call.
+    """
+    queues: Dict[str, deque] = {}
+    for url in dict.fromkeys(u for u in urls if u):
+        queues.setdefault(urlsplit(url).netloc, deque()).append(url)
+    ready = deque(queues)  # hosts with queued URLs, served round robin
+    active = {host: 0 for host in queues}
+    pending: Dict = {}  # future -> (url, host)
+    results: Dict[str, Dict] = {}
+    health = _load_health()
+
+    def dispatch():
+        # Hand out URLs round robin over hosts below their limit until the pool is full
+        blocked = 0
+        while ready and len(pending) < max_workers and blocked < len(ready):
+            host = ready[0]
+            ready.rotate(-1)
+            if active[host] >= per_host:
+                blocked += 1
+                continue
+            blocked = 0
+            url = queues[host].popleft()
+            if not queues[host]:
+                ready.remove(host)
+            active[host] += 1
+            pending[pool.submit(probe_url, url, timeout)] = (url, host)
+
+    saved_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stream-probe") as pool:
+        try:
+            dispatch()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, host = pending.pop(future)
+                    active[host] -= 1
+                    results[url] = future.result()
+                    with _health_lock:
+                        health[url] = results[url]
+                dispatch()
+                if time.monotonic() - saved_at >= _SAVE_INTERVAL:
+                    _save_health()
+                    saved_at = time.monotonic()
+        finally:
+            for future in pending:
+                future.cancel()
+            _save_health()
+    return results
+
+
+def stale_urls(urls: Iterable[str]) -> List[str]:
+    """URLs that were never probed or whose result is older than PROBE_TTL."""
+    now = time.time()
+    health = _load_health()
+    return [u for u in urls if now - health.get(u, {}).get("checked_at", 0) >= PROBE_TTL]
+
+
+def start_background_probe(urls: Iterable[str]) -> Optional[threading.Thread]:
+    """Probe stale URLs in a daemon thread; no-op if a probe run is already going."""
+    global _probe_thread
+    if _probe_thread is not None and _probe_thread.is_alive():
+        return None
+    todo = stale_urls(urls)
+    if not todo:
+        return None
+
+    def worker():
+        started = time.perf_counter()
+        try:
+            results = probe_urls(todo)
+            alive = sum(1 for r in results.values() if r["alive"])
+            print(f"[stream_probe] Probed {len(results)} streams ({alive} alive) in {time.perf_counter() - started:.1f}s")
+        except Exception as exc:
+            print(f"[stream_probe] Background probe failed: {exc}")
+
+    _probe_thread = threading.Thread(target=worker, name="stream-probe", daemon=True)
+    _probe_thread.start()
+    return _probe_thread
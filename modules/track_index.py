@@ -0,0 +1,318 @@
+"""
+Local track metadata index: SQLite FTS5 over every track Deezer has returned.
+
+Tracks are stored in `tracks.db` next to users.db. For every query, the
+results Deezer returned are kept in Deezer's order, so a repeat search is
+answered locally, page by page, for as far as Deezer was already asked;
+later pages still come from Deezer and continue the same order. Tracks are
+also indexed by title, artist and album, so a related one-off search ("daft
+pun" after "daft punk") can be answered from everything seen so far; only
+music.search_tracks asks for that, since the /music page and the desktop app
+page through results and so keep Deezer's order. The index is bounded: past MAX_TRACKS, the tracks seen least recently are
+evicted.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DB_PATH = Path(os.environ.get("MUSIC_TRACK_DB", str(PROJECT_ROOT / "tracks.db")))
+# Tracks kept in the index; the least recently seen ones are evicted past this
+MAX_TRACKS = int(os.environ.get("MUSIC_TRACK_INDEX_SIZE", "50000"))
+# How long (seconds) the stored results of a query are served locally
+SEARCH_TTL = float(os.environ.get("MUSIC_TRACK_INDEX_TTL", "86400"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_initialized_path: Optional[Path] = None
+_init_lock = threading.Lock()
+_stats = {"local_hits": 0, "local_misses": 0, "evicted": 0}
+_stats_lock = threading.Lock()
+
+
+@contextmanager
+def get_db_connection():
+    """
+    Context manager for track index connections (commits on success, rolls back on error).
+    The schema is created on first use.
+    """
+    _ensure_db()
+    conn = sqlite3.connect(str(DB_PATH), timeout=5)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _ensure_db() -> None:
+    global _initialized_path
+    if _initialized_path == DB_PATH:
+        return
+    with _init_lock:
+        if _initialized_path == DB_PATH:
+            return
+        conn = sqlite3.connect(str(DB_PATH), timeout=5)
+        try:
+            # WAL lets searches read while another thread or worker writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    id INTEGER PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    artist TEXT NOT NULL DEFAULT '',
+                    album TEXT NOT NULL DEFAULT '',
+                    cover TEXT,
+                    preview_url TEXT,
+                    link TEXT,
+                    last_seen REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_tracks_last_seen ON tracks(last_seen);
+
+                CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+                    title, artist, album,
+                    content='tracks', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN
+                    INSERT INTO tracks_fts(rowid, title, artist, album)
+                    VALUES (new.id, new.title, new.artist, new.album);
+                END;
+                CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN
+                    INSERT INTO tracks_fts(tracks_fts, rowid, title, artist, album)
+                    VALUES ('delete', old.id, old.title, old.artist, old.album);
+                END;
+                CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE OF title, artist, album ON tracks BEGIN
+                    INSERT INTO tracks_fts(tracks_fts, rowid, title, artist, album)
+                    VALUES ('delete', old.id, old.title, old.artist, old.album);
+                    INSERT INTO tracks_fts(rowid, title, artist, album)
+                    VALUES (new.id, new.title, new.artist, new.album);
+                END;
+
+                -- Queries asked of Deezer; `total` is set once its last page was seen
+                CREATE TABLE IF NOT EXISTS queries (
+                    query TEXT PRIMARY KEY,
+                    total INTEGER,
+                    searched_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_queries_searched_at ON queries(searched_at);
+                -- Deezer's result order for each query
+                CREATE TABLE IF NOT EXISTS query_results (
+                    query TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    track_id INTEGER NOT NULL,
+                    PRIMARY KEY (query, position)
+                ) WITHOUT ROWID;
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+        _initialized_path = DB_PATH
+
+
+def _normalize(query: str) -> str:
+    return " ".join(_TOKEN_RE.findall(query.lower()))
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """FTS5 query matching every word of `query` as a prefix ("daft pun" finds "Daft Punk")."""
+    tokens = _TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    return " ".join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+def _count(name: str, delta: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += delta
+
+
+def _track_from_row(row: sqlite3.Row) -> Dict:
+    """Shape a stored track like music.search_tracks results."""
+    return {
+        "id": row["id"],
+        "name": row["title"],
+        "artists": row["artist"],
+        "album": row["album"],
+        "image": row["cover"],
+        "preview_url": row["preview_url"],
+        "external_url": row["link"],
+    }
+
+
+def search_page(query: str, index: int = 0, limit: int = 12) -> Optional[Tuple[List[Dict], Optional[int]]]:
+    """
+    Answer one page of a repeat search from the results Deezer returned for it.
+
+    Only positions Deezer already returned for this exact query are served,
+    in Deezer's order, so local pages and Deezer pages of one query never
+    mix two rankings.
+
+    Returns:
+        (tracks, index of the next page or None at the end of the results), or
+        None when Deezer has to be asked.
+    """
+    normalized = _normalize(query)
+    if not normalized:
+        return None
+    try:
+        with get_db_connection() as conn:
+            searched = conn.execute(
+                "SELECT total FROM queries WHERE query = ? AND searched_at >= ?",
+                (normalized, time.time() - SEARCH_TTL),
+            ).fetchone()
+            if searched is None:
+                _count("local_misses")
+                return None
+            total = searched["total"]
+            end = index + limit if total is None else min(index + limit, total)
+            rows = conn.execute(
+                """
+                SELECT tracks.* FROM query_results JOIN tracks ON tracks.id = query_results.track_id
+                WHERE query_results.query = ? AND position >= ? AND position < ?
+                ORDER BY position
+                """,
+                (normalized, index, end),
+            ).fetchall()
+    except sqlite3.Error as exc:
+        print(f"[track_index.search_page] Local search failed: {exc}")
+        return None
+
+    # A gap (page never fetched, or a track evicted since) means asking Deezer
+    if len(rows) < end - index:
+        _count("local_misses")
+        return None
+    _count("local_hits")
+    # Only the last page Deezer reported ends the results
+    next_index = end if total is None or end < total else None
+    return [_track_from_row(row) for row in rows], next_index
+
+
+def search_related(query: str, limit: int = 12) -> Optional[List[Dict]]:
+    """
+    Answer a one-page search from every stored track, if a full page matches.
+
+    Every word of the query matches as a prefix of the title, artist or album
+    ("daft pun" finds "Daft Punk"), ranked by title, then artist, then album
+    relevance. The ranking is not Deezer's, so this is only for searches
+    that are not paged further.
+
+    Returns:
+        `limit` tracks, or None when fewer match and Deezer has to be asked.
+    """
+    match = _match_expression(query)
+    if match is None:
+        return None
+    try:
+        with get_db_connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT tracks.* FROM tracks_fts JOIN tracks ON tracks.id = tracks_fts.rowid
+                WHERE tracks_fts MATCH ?
+                ORDER BY bm25(tracks_fts, 10.0, 5.0, 1.0)
+                LIMIT ?
+                """,
+                (match, limit),
+            ).fetchall()
+    except sqlite3.Error as exc:
+        print(f"[track_index.search_related] Local search failed: {exc}")
+        return None
+    if len(rows) < limit:
+        _count("local_misses")
+        return None
+    _count("local_hits")
+    return [_track_from_row(row) for row in rows]
+
+
+def add_tracks(query: str, index: int, tracks: List[Dict], next_index: Optional[int]) -> None:
+    """
+    Store a page of tracks Deezer returned for `query`, then evict if over MAX_TRACKS.
+
+    Args:
+        query: The search that returned them
+        index: Result index of the page
+        tracks: Tracks shaped as by music.search_tracks
+        next_index: Deezer's next page index; None means this was the last page
+    """
+    now = time.time()
+    tracks = [t for t in tracks if t.get("id") is not None]
+    rows = [
+        (t["id"], t.get("name") or "", t.get("artists") or "", t.get("album") or "",
+         t.get("image"), t.get("preview_url"), t.get("external_url"), now)
+        for t in tracks
+    ]
+    normalized = _normalize(query)
+    try:
+        with get_db_connection() as conn:
+            conn.executemany(
+                """
+                INSERT INTO tracks (id, title, artist, album, cover, preview_url, link, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    title = excluded.title, artist = excluded.artist, album = excluded.album,
+                    cover = excluded.cover, preview_url = excluded.preview_url, link = excluded.link,
+                    last_seen = excluded.last_seen
+                """,
+                rows,
+            )
+            if normalized:
+                if index == 0:
+                    # A fresh first page starts the query's listing over
+                    conn.execute("DELETE FROM query_results WHERE query = ?", (normalized,))
+                    total = None
+                else:
+                    known = conn.execute("SELECT total FROM queries WHERE query = ?", (normalized,)).fetchone()
+                    total = known[0] if known is not None else None
+                if next_index is None:
+                    total = index + len(tracks)
+                conn.execute(
+                    "INSERT OR REPLACE INTO queries (query, total, searched_at) VALUES (?, ?, ?)",
+                    (normalized, total, now),
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO query_results (query, position, track_id) VALUES (?, ?, ?)",
+                    [(normalized, index + i, t["id"]) for i, t in enumerate(tracks)],
+                )
+            _evict(conn, now)
+    except sqlite3.Error as exc:
+        print(f"[track_index.add_tracks] Could not store tracks: {exc}")
+
+
+def _evict(conn: sqlite3.Connection, now: float) -> None:
+    """Drop expired queries, and the least recently seen tracks past MAX_TRACKS (down to 90%, so this runs rarely)."""
+    expired = "SELECT query FROM queries WHERE searched_at < ?"
+    conn.execute(f"DELETE FROM query_results WHERE query IN ({expired})", (now - SEARCH_TTL,))
+    conn.execute("DELETE FROM queries WHERE searched_at < ?", (now - SEARCH_TTL,))
+    count = conn.execute("SELECT count(*) FROM tracks").fetchone()[0]
+    if count <= MAX_TRACKS:
+        return
+    excess = count - int(MAX_TRACKS * 0.9)
+    conn.execute(
+        "DELETE FROM tracks WHERE id IN (SELECT id FROM tracks ORDER BY last_seen LIMIT ?)",
+        (excess,),
+    )
+    # Stored result lists pointing at evicted tracks now have gaps; search_page
+    # falls back to Deezer for those pages, so only the dangling rows go
+    conn.execute("DELETE FROM query_results WHERE track_id NOT IN (SELECT id FROM tracks)")
+    _count("evicted", excess)
+
+
+def stats() -> Dict[str, int]:
+    """Local hit/miss/eviction counters and the number of stored tracks."""
+    with _stats_lock:
+        result = dict(_stats)
+    try:
+        with get_db_connection() as conn:
+            result["local_tracks"] = conn.execute("SELECT count(*) FROM tracks").fetchone()[0]
+    except sqlite3.Error:
+        result["local_tracks"] = 0
+    return result
@@ -0,0 +1,828 @@
+"""
+Compact records and search index structures for the IPTV channel catalog.
+"""
+import codecs
+import copy
+import json
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Runs of letters/digits. Channel names and queries are tokenized the same way.
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+_JSON_WS_RE = re.compile(r"[ \t\n\r]*")
+# Bytes read per step when parsing feeds incrementally
+_JSON_CHUNK_SIZE = 1 << 16
+
+# Country filter strings come from users; cap how many resolutions we remember
+_MAX_RESOLVED_COUNTRIES = 1024
+
+# Neighbour list length kept per channel for related-channel rails
+_MAX_RELATED = 24
+
+# Patch a catalog only while at most this share of channel slots, name
+# trigram strings or name tokens is dead (left behind by removed or renamed
+# channels); past that a full rebuild compacts the indexes again
+_MAX_DEAD_SHARE = 0.25
+
+
+def _intern(value) -> str:
+    """Intern short repeated codes so every record shares one string object."""
+    return sys.intern(value) if isinstance(value, str) else ""
+
+
+class ChannelRecord:
+    """
+    The fields of a channels.json entry that search actually reads.
+
+    Feed entries carry a dozen more fields (network, owners, website, ...);
+    keeping only these in __slots__ records is a fraction of the dict size.
+    """
+
+    __slots__ = ("id", "name", "alt_names", "country", "categories", "logo")
+
+    def __init__(
+        self,
+        id: str,
+        name: str,
+        country: str,
+        categories: Tuple[str, ...],
+        logo: str,
+        alt_names: Tuple[str, ...] = (),
+    ):
+        self.id = id
+        self.name = name
+        self.alt_names = alt_names
+        self.country = country
+        self.categories = categories
+        self.logo = logo
+
+    def __repr__(self) -> str:
+        return f"ChannelRecord({self.id!r}, {self.name!r})"
+
+
+class StreamRecord:
+    """The fields of a streams.json entry needed to play a channel."""
+
+    __slots__ = ("channel", "url", "quality")
+
+    def __init__(self, channel: str, url: str, quality: str):
+        self.channel = channel
+        self.url = url
+        self.quality = quality
+
+    def __repr__(self) -> str:
+        return f"StreamRecord({self.channel!r}, {self.url!r})"
+
+
+def channels_from_feed(items: Iterable[Dict]) -> List[ChannelRecord]:
+    """
+    Convert parsed channels.json entries to compact records.
+
+    Channel ids and country codes are interned; category tuples are shared
+    between channels with the same (lowercased) categories.
+    """
+    category_tuples: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+    records = []
+    for item in items:
+        categories = tuple(_intern(c.lower()) for c in item.get("categories") or [] if isinstance(c, str))
+        categories = category_tuples.setdefault(categories, categories)
+        records.append(
+            ChannelRecord(
+                _intern(item.get("id", "")),
+                item.get("name", "Unknown Channel") or "",
+                _intern(item.get("country") or ""),
+                categories,
+                item.get("logo") or "",
+                tuple(n for n in item.get("alt_names") or [] if isinstance(n, str) and n),
+            )
+        )
+    return records
+
+
+def streams_from_feed(items: Iterable[Dict]) -> List[StreamRecord]:
+    """Convert parsed streams.json entries to compact records (channel ids interned)."""
+    return [
+        StreamRecord(_intern(item.get("channel") or ""), item.get("url") or "", _intern(item.get("quality") or ""))
+        for item in items
+    ]
+
+
+def iter_json_array(f: BinaryIO, chunk_size: int = _JSON_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Yield the items of a top-level JSON array read from a binary file, one at a time.
+
+    Only the current chunk of text and the item being decoded are held, so a
+    feed can be projected into compact records without the full list of
+    decoded dicts ever existing.
+
+    Raises:
+        ValueError: If the document is not a well-formed JSON array.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8-sig")()
+    buf, pos, eof = "", 0, False
+    state = "start"  # start -> first -> (item -> after)* -> done
+    while True:
+        pos = _JSON_WS_RE.match(buf, pos).end()
+        item = end = None
+        if pos < len(buf):
+            if state == "done":
+                raise ValueError("Extra data after JSON array")
+            if state == "start":
+                if buf[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                pos, state = pos + 1, "first"
+                continue
+            if state == "after" or (state == "first" and buf[pos] == "]"):
+                if buf[pos] == "]":
+                    pos, state = pos + 1, "done"
+                    continue
+                if buf[pos] != ",":
+                    raise ValueError(f"Expected ',' or ']' in JSON array, got {buf[pos]!r}")
+                pos, state = pos + 1, "item"
+                continue
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            # Only trust an item once the delimiter after it is in the buffer: a number
+            # cut at the chunk boundary ("-1." + "5e3") decodes early otherwise
+            if end is not None and (eof or (end < len(buf) and buf[end] in ",] \t\n\r")):
+                yield item
+                pos, state = end, "after"
+                continue
+        if eof:
+            if state == "done":
+                return
+            raise ValueError("Unexpected end of JSON array")
+        # Need more text: keep the unparsed tail, read at least as much again
+        chunk = f.read(max(chunk_size, len(buf) - pos))
+        eof = not chunk
+        buf = buf[pos:] + text.decode(chunk, final=eof)
+        pos = 0
+
+
+def channels_from_json(f: BinaryIO) -> List[ChannelRecord]:
+    """Parse a channels.json file straight into compact records (see iter_json_array)."""
+    return channels_from_feed(iter_json_array(f))
+
+
+def streams_from_json(f: BinaryIO) -> List[StreamRecord]:
+    """Parse a streams.json file straight into compact records (see iter_json_array)."""
+    return streams_from_feed(iter_json_array(f))
+
+
+def _record_key(channel: ChannelRecord) -> Tuple:
+    return (channel.name, channel.alt_names, channel.country, channel.categories, channel.logo)
+
+
+def _streams_key(streams: Optional[List[StreamRecord]]) -> Tuple:
+    return tuple((stream.url, stream.quality) for stream in streams or ())
+
+
+# A change to one channel slot: (position, record before or None, record after or None)
+Change = Tuple[int, Optional[ChannelRecord], Optional[ChannelRecord]]
+
+
+def _inserted(positions: List[int], pos: int) -> List[int]:
+    """A copy of a sorted position list with `pos` added."""
+    i = bisect_left(positions, pos)
+    return positions[:i] + [pos] + positions[i:]
+
+
+def _removed(positions: List[int], pos: int) -> List[int]:
+    """A copy of a sorted position list with `pos` dropped."""
+    i = bisect_left(positions, pos)
+    if i < len(positions) and positions[i] == pos:
+        return positions[:i] + positions[i + 1:]
+    return positions
+
+
+def _with_position(postings: Dict, key, pos: int) -> None:
+    postings[key] = _inserted(postings.get(key, []), pos)
+
+
+def _without_position(postings: Dict, key, pos: int) -> None:
+    remaining = _removed(postings.get(key, []), pos)
+    if remaining:
+        postings[key] = remaining
+    else:
+        postings.pop(key, None)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split already-lowercased text into alphanumeric tokens."""
+    return _TOKEN_RE.findall(text)
+
+
+class TokenIndex:
+    """
+    Inverted index over channel names.
+
+    Every name is split into tokens and each token keeps a posting list of
+    channel positions. A sorted list of all token suffixes lets us find every
+    token that *contains* a query fragment with a binary search, so the index
+    can narrow a substring query without scanning the whole catalog.
+
+    The candidates returned are a superset of the real matches: callers still
+    run the plain `query in name` check on them, which keeps the results
+    identical to a full scan.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        postings: Dict[str, List[int]] = {}
+        for pos, name in enumerate(names):
+            for token in set(tokenize(name.lower())):
+                postings.setdefault(token, []).append(pos)
+
+        self._tokens: List[str] = list(postings)
+        self._postings: List[List[int]] = [postings[t] for t in self._tokens]
+
+        suffixes = []
+        for token_id, token in enumerate(self._tokens):
+            for start in range(len(token)):
+                suffixes.append((token[start:], token_id))
+        suffixes.sort()
+        self._suffixes: List[str] = [s for s, _ in suffixes]
+        self._suffix_tokens: List[int] = [t for _, t in suffixes]
+        self._empty = 0  # tokens whose channels were all renamed or removed by patches
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def dead_share(self) -> float:
+        """Share of tokens (and so of suffixes) no channel has any more."""
+        return self._empty / len(self._tokens) if self._tokens else 0.0
+
+    def patched(self, changes: List[Change]) -> "TokenIndex":
+        """
+        Return a copy with the changed channels re-indexed.
+
+        Posting lists that change are replaced, never mutated, so this index
+        stays valid for requests still using it. Tokens that lose their last
+        channel keep an empty posting list until the next full rebuild.
+        """
+        new = copy.copy(self)
+        new._tokens = list(self._tokens)
+        new._postings = list(self._postings)
+        token_ids = {token: token_id for token_id, token in enumerate(self._tokens)}
+        added_suffixes = []
+        for pos, old, record in changes:
+            old_tokens = set(tokenize(old.name.lower())) if old else set()
+            new_tokens = set(tokenize(record.name.lower())) if record else set()
+            for token in old_tokens - new_tokens:
+                token_id = token_ids[token]
+                new._postings[token_id] = _removed(new._postings[token_id], pos)
+                if not new._postings[token_id]:
+                    new._empty += 1
+            for token in new_tokens - old_tokens:
+                token_id = token_ids.get(token)
+                if token_id is None:
+                    token_id = token_ids[token] = len(new._tokens)
+                    new._tokens.append(token)
+                    new._postings.append([])
+                    added_suffixes.extend((token[start:], token_id) for start in range(len(token)))
+                elif not new._postings[token_id]:
+                    new._empty -= 1
+                new._postings[token_id] = _inserted(new._postings[token_id], pos)
+
+        if added_suffixes:
+            new._suffixes = list(self._suffixes)
+            new._suffix_tokens = list(self._suffix_tokens)
+            for suffix, token_id in added_suffixes:
+                i = bisect_left(new._suffixes, suffix)
+                new._suffixes.insert(i, suffix)
+                new._suffix_tokens.insert(i, token_id)
+        return new
+
+    def _fragment_positions(self, fragment: str) -> Set[int]:
+        """Positions of every channel with a token containing `fragment`."""
+        token_ids = set()
+        i = bisect_left(self._suffixes, fragment)
+        while i < len(self._suffixes) and self._suffixes[i].startswith(fragment):
+            token_ids.add(self._suffix_tokens[i])
+            i += 1
+
+        positions: Set[int] = set()
+        for token_id in token_ids:
+            positions.update(self._postings[token_id])
+        return positions
+
+    def candidates(self, query_lower: str) -> Optional[List[int]]:
+        """
+        Return sorted channel positions that may contain `query_lower`.
+
+        Returns None when the query has no alphanumeric fragment to look up
+        (e.g. "+"), in which case the caller has to fall back to a full scan.
+        """
+        fragments = sorted(set(tokenize(query_lower)), key=len, reverse=True)
+        if not fragments:
+            return None
+
+        result: Optional[Set[int]] = None
+        for fragment in fragments:
+            positions = self._fragment_positions(fragment)
+            result = positions if result is None else result & positions
+            if not result:
+                return []
+        return sorted(result)
+
+
+class FacetIndex:
+    """
+    Country and category facets: filter value -> sorted channel positions.
+
+    Country filters accept a code ("US", exact, case-insensitive) or part of
+    a country name ("united"). Each distinct filter string is resolved to its
+    set of country codes once and remembered, so filtering is a dict lookup.
+    """
+
+    def __init__(self, channels: List[ChannelRecord], countries_map: Dict[str, str]):
+        self._by_country: Dict[str, List[int]] = {}
+        self._by_category: Dict[str, List[int]] = {}
+        for pos, channel in enumerate(channels):
+            if channel.country:
+                self._by_country.setdefault(channel.country, []).append(pos)
+            for category in channel.categories:
+                self._by_category.setdefault(category, []).append(pos)
+
+        self._set_country_keys(countries_map)
+
+    def _set_country_keys(self, countries_map: Dict[str, str]) -> None:
+        # (code, code lowercased, country name lowercased) for every code in use
+        self._country_keys = [
+            (code, code.lower(), countries_map.get(code, "").lower()) for code in self._by_country
+        ]
+        self._resolved: Dict[str, List[int]] = {}
+
+    def patched(self, changes: List[Change], countries_map: Dict[str, str]) -> "FacetIndex":
+        """Return a copy with the changed channels moved between facets (lists are replaced, not mutated)."""
+        new = copy.copy(self)
+        new._by_country = dict(self._by_country)
+        new._by_category = dict(self._by_category)
+        for pos, old, record in changes:
+            if old is not None:
+                if old.country:
+                    _without_position(new._by_country, old.country, pos)
+                for category in old.categories:
+                    _without_position(new._by_category, category, pos)
+            if record is not None:
+                if record.country:
+                    _with_position(new._by_country, record.country, pos)
+                for category in record.categories:
+                    _with_position(new._by_category, category, pos)
+        new._set_country_keys(countries_map)
+        return new
+
+    def country_codes(self, country_lower: str) -> List[str]:
+        """Country codes matching a filter by code or by country name substring."""
+        return [
+            code
+            for code, code_lower, name_lower in self._country_keys
+            if country_lower == code_lower or (name_lower and country_lower in name_lower)
+        ]
+
+    def country_positions(self, country_lower: str) -> List[int]:
+        """Sorted positions of channels matching a (lowercased) country filter."""
+        positions = self._resolved.get(country_lower)
+        if positions is None:
+            codes = self.country_codes(country_lower)
+            if len(codes) == 1:
+                positions = self._by_country[codes[0]]
+            else:
+                positions = sorted(pos for code in codes for pos in self._by_country[code])
+            if len(self._resolved) < _MAX_RESOLVED_COUNTRIES:
+                self._resolved[country_lower] = positions
+        return positions
+
+    def code_positions(self, code: str) -> List[int]:
+        """Sorted positions of channels with exactly this country code."""
+        return self._by_country.get(code, [])
+
+    def category_positions(self, category_lower: str) -> List[int]:
+        """Sorted positions of channels tagged with a (lowercased) category."""
+        return self._by_category.get(category_lower, [])
+
+
+def trigrams(text_lower: str) -> Set[str]:
+    """Character trigrams of each token, padded like pg_trgm ("  cnn " -> "  c", " cn", "cnn", "nn ")."""
+    grams = set()
+    for token in tokenize(text_lower):
+        padded = f"  {token} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class TrigramIndex:
+    """
+    Trigram index over channel names and alt_names for typo-tolerant search.
+
+    Similarity is the Jaccard index of the query's and the name's trigram
+    sets; a channel scores as its best-matching name.
+    """
+
+    def __init__(self, channels: List[ChannelRecord]):
+        postings: Dict[str, array] = {}
+        self._string_channel = array("I")  # string id -> channel position
+        self._string_size = array("H")  # string id -> number of trigrams
+        self._dead: Set[int] = set()  # string ids of names replaced by a patch
+        self._postings = postings
+        for pos, channel in enumerate(channels):
+            self._add_strings(pos, channel, None)
+
+    def _add_strings(self, pos: int, channel: ChannelRecord, owned: Optional[Set[str]]) -> None:
+        """
+        Index a channel's names. With `owned` given, posting arrays not in it
+        are shared with another index and get copied before the append.
+        """
+        for name in (channel.name,) + channel.alt_names:
+            grams = trigrams(name.lower())
+            if not grams:
+                continue
+            string_id = len(self._string_channel)
+            self._string_channel.append(pos)
+            self._string_size.append(min(len(grams), 0xFFFF))
+            for gram in grams:
+                bucket = self._postings.get(gram)
+                if bucket is None:
+                    bucket = self._postings[gram] = array("I")
+                    if owned is not None:
+                        owned.add(gram)
+                elif owned is not None and gram not in owned:
+                    bucket = self._postings[gram] = array("I", bucket)
+                    owned.add(gram)
+                bucket.append(string_id)
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def dead_share(self) -> float:
+        """Share of indexed name strings that are dead but still in the posting arrays."""
+        return len(self._dead) / len(self._string_channel) if len(self._string_channel) else 0.0
+
+    def patched(self, changes: List[Change]) -> "TrigramIndex":
+        """
+        Return a copy with the changed channels re-indexed.
+
+        Names of removed or changed channels are marked dead rather than
+        pulled out of the posting arrays; new names get fresh string ids.
+        """
+        new = copy.copy(self)
+        new._postings = dict(self._postings)
+        new._string_channel = array("I", self._string_channel)
+        new._string_size = array("H", self._string_size)
+        new._dead = set(self._dead)
+
+        replaced = {pos for pos, old, _record in changes if old is not None}
+        if replaced:
+            new._dead.update(
+                string_id for string_id, pos in enumerate(self._string_channel) if pos in replaced
+            )
+        owned: Set[str] = set()
+        for pos, _old, record in changes:
+            if record is not None:
+                new._add_strings(pos, record, owned)
+        return new
+
+    def search(self, query_lower: str, threshold: float = 0.3) -> List[Tuple[int, float]]:
+        """
+        Rank channels by trigram similarity to the query.
+
+        Returns:
+            (channel position, similarity) pairs with similarity >= threshold,
+            best first; ties keep catalog order.
+        """
+        query_grams = trigrams(query_lower)
+        if not query_grams:
+            return []
+
+        shared: Dict[int, int] = {}
+        for gram in query_grams:
+            for string_id in self._postings.get(gram, ()):
+                shared[string_id] = shared.get(string_id, 0) + 1
+
+        best: Dict[int, float] = {}
+        query_size = len(query_grams)
+        dead = self._dead
+        for string_id, common in shared.items():
+            if string_id in dead:
+                continue
+            score = common / (query_size + self._string_size[string_id] - common)
+            if score >= threshold:
+                pos = self._string_channel[string_id]
+                if score > best.get(pos, 0.0):
+                    best[pos] = score
+        return sorted(best.items(), key=lambda item: (-item[1], item[0]))
+
+
+class PrefixIndex:
+    """
+    Sorted-array index for name autocompletion.
+
+    Two sorted arrays of (lowercased key, channel position): one keyed on the
+    full name, one on every later word of the name ("bbc news" is also found
+    under "news"). A prefix lookup is a binary search plus a short walk.
+    """
+
+    def __init__(self, channels: List[ChannelRecord], positions: Iterable[int]):
+        names = []
+        words = []
+        for pos in positions:
+            name_key, word_keys = self._keys(channels[pos].name.lower())
+            names.append((name_key, pos))
+            words.extend((key, pos) for key in word_keys)
+        names.sort()
+        words.sort()
+        self._name_keys = [key for key, _ in names]
+        self._name_positions = array("I", (pos for _, pos in names))
+        self._word_keys = [key for key, _ in words]
+        self._word_positions = array("I", (pos for _, pos in words))
+
+    @staticmethod
+    def _keys(name_lower: str) -> Tuple[str, List[str]]:
+        """The full-name key and the later-word keys of a lowercased name."""
+        return name_lower, [name_lower[match.start():] for match in list(_TOKEN_RE.finditer(name_lower))[1:]]
+
+    @staticmethod
+    def _remove(keys: List[str], positions: array, key: str, pos: int) -> None:
+        i = bisect_left(keys, key)
+        while i < len(keys) and keys[i] == key:
+            if positions[i] == pos:
+                del keys[i]
+                del positions[i]
+                return
+            i += 1
+
+    @staticmethod
+    def _insert(keys: List[str], positions: array, key: str, pos: int) -> None:
+        i = bisect_left(keys, key)
+        while i < len(keys) and keys[i] == key and positions[i] < pos:
+            i += 1
+        keys.insert(i, key)
+        positions.insert(i, pos)
+
+    def patched(self, changes: List[Change]) -> "PrefixIndex":
+        """Return a copy with the entries of the changed channels removed and/or re-inserted."""
+        new = copy.copy(self)
+        new._name_keys = list(self._name_keys)
+        new._name_positions = array("I", self._name_positions)
+        new._word_keys = list(self._word_keys)
+        new._word_positions = array("I", self._word_positions)
+        for pos, old, record in changes:
+            if old is not None:
+                name_key, word_keys = self._keys(old.name.lower())
+                self._remove(new._name_keys, new._name_positions, name_key, pos)
+                for key in word_keys:
+                    self._remove(new._word_keys, new._word_positions, key, pos)
+            if record is not None:
+                name_key, word_keys = self._keys(record.name.lower())
+                self._insert(new._name_keys, new._name_positions, name_key, pos)
+                for key in word_keys:
+                    self._insert(new._word_keys, new._word_positions, key, pos)
+        return new
+
+    @staticmethod
+    def _walk(keys: List[str], positions: array, prefix: str, k: int, seen: Dict[int, None]) -> None:
+        i = bisect_left(keys, prefix)
+        while len(seen) < k and i < len(keys) and keys[i].startswith(prefix):
+            seen.setdefault(positions[i], None)
+            i += 1
+
+    def complete(self, prefix_lower: str, k: int) -> List[int]:
+        """Positions of up to k channels whose name, then any later word, starts with the prefix."""
+        if not prefix_lower or k <= 0:
+            return []
+        seen: Dict[int, None] = {}
+        self._walk(self._name_keys, self._name_positions, prefix_lower, k, seen)
+        self._walk(self._word_keys, self._word_positions, prefix_lower, k, seen)
+        return list(seen)
+
+
+class Catalog:
+    """
+    One consistent version of the channel catalog together with its indexes.
+
+    Everything is built in the constructor and never mutated afterwards
+    (apart from the memoized related-channel lists), so a new version can be
+    built off to the side and swapped in with a single assignment while
+    requests keep using the version they started with.
+
+    `patched()` derives the next version from this one when a refresh only
+    touched a few channels. Channel positions stay stable across patches:
+    new channels are appended, and removed ones leave a dead slot that no
+    index or `positions_by_id` points to.
+    """
+
+    def __init__(
+        self,
+        channels: List[ChannelRecord],
+        streams_map: Dict[str, List[StreamRecord]],
+        countries: Dict[str, str],
+        version: int,
+    ):
+        self.channels = channels
+        self.streams_map = streams_map
+        self.countries = countries
+        self.version = version
+        self.tokens = TokenIndex(channel.name for channel in channels)
+        self.facets = FacetIndex(channels, countries)
+        self.trigrams = TrigramIndex(channels)
+        self.positions_by_id: Dict[str, int] = {channel.id: pos for pos, channel in enumerate(channels)}
+        # Duplicate ids in the feed make id-based diffing ambiguous
+        self._patchable = len(self.positions_by_id) == len(channels)
+        self._related: Dict[int, List[int]] = {}
+
+        # Filter vocabularies: playable channels per country code / category.
+        # Every known country and every category seen in the feed is listed,
+        # with a count of 0 if none of its channels has a stream.
+        self.country_counts: Dict[str, int] = dict.fromkeys(countries, 0)
+        self.category_counts: Dict[str, int] = {}
+        self.playable: Set[int] = set()
+        for pos, channel in enumerate(channels):
+            streams = streams_map.get(channel.id)
+            playable = bool(streams) and any(stream.url for stream in streams)
+            if playable:
+                self.playable.add(pos)
+            if channel.country:
+                self.country_counts[channel.country] = self.country_counts.get(channel.country, 0) + playable
+            for category in channel.categories:
+                if category:
+                    self.category_counts[category] = self.category_counts.get(category, 0) + playable
+        self.prefixes = PrefixIndex(channels, sorted(self.playable))
+        self._set_vocabularies()
+
+    def _set_vocabularies(self) -> None:
+        self.countries_by_name: List[Tuple[str, str]] = sorted(self.countries.items(), key=lambda item: item[1])
+        self.categories_by_name: List[str] = sorted(self.category_counts)
+
+    def patched(
+        self,
+        records: List[ChannelRecord],
+        streams_map: Dict[str, List[StreamRecord]],
+        countries: Dict[str, str],
+        version: int,
+    ) -> Optional[Tuple["Catalog", Dict[str, int]]]:
+        """
+        Derive the next catalog version by diffing new feed data against this one.
+
+        Channels are matched by id. Only added, removed and changed channels,
+        and channels whose stream list changed, are re-indexed; everything
+        else is shared with this version, which is left untouched.
+
+        Returns:
+            (new catalog, {"added", "removed", "changed", "streams_changed"}),
+            or None if a full rebuild is the better choice (duplicate ids, or
+            too many dead slots, name strings or tokens would pile up).
+        """
+        by_id = {record.id: record for record in records}
+        if len(by_id) != len(records) or not self._patchable:
+            return None
+
+        channels = list(self.channels)
+        positions_by_id = dict(self.positions_by_id)
+        changes: List[Change] = []
+        for channel_id, pos in self.positions_by_id.items():
+            if channel_id not in by_id:
+                del positions_by_id[channel_id]
+                changes.append((pos, channels[pos], None))
+        removed = len(changes)
+        added = 0
+        for record in records:
+            pos = positions_by_id.get(record.id)
+            if pos is None:
+                pos = positions_by_id[record.id] = len(channels)
+                channels.append(record)
+                changes.append((pos, None, record))
+                added += 1
+            elif channels[pos] is not record and _record_key(channels[pos]) != _record_key(record):
+                changes.append((pos, channels[pos], record))
+                channels[pos] = record
+
+        dead = len(channels) - len(positions_by_id)
+        if dead > _MAX_DEAD_SHARE * len(channels):
+            return None
+
+        # Channels whose playability may have changed
+        affected = {pos for pos, _old, _record in changes}
+        streams_changed = 0
+        if streams_map is not self.streams_map:
+            for channel_id in self.streams_map.keys() | streams_map.keys():
+                if _streams_key(self.streams_map.get(channel_id)) != _streams_key(streams_map.get(channel_id)):
+                    streams_changed += 1
+                    pos = positions_by_id.get(channel_id)
+                    if pos is not None:
+                        affected.add(pos)
+
+        new = copy.copy(self)
+        new.channels = channels
+        new.streams_map = streams_map
+        new.countries = countries
+        new.version = version
+        new.positions_by_id = positions_by_id
+        new._related = {}
+        new.tokens = self.tokens.patched(changes) if changes else self.tokens
+        new.facets = self.facets.patched(changes, countries)
+        new.trigrams = self.trigrams.patched(changes) if changes else self.trigrams
+        # Renamed channels keep their slot but leave dead index entries that every search scans
+        if max(new.tokens.dead_share(), new.trigrams.dead_share()) > _MAX_DEAD_SHARE:
+            return None
+
+        new.playable = set(self.playable)
+        new.country_counts = dict(self.country_counts)
+        for code in countries:
+            new.country_counts.setdefault(code, 0)
+        new.category_counts = dict(self.category_counts)
+        prefix_changes: List[Change] = []
+        for pos in sorted(affected):
+            before = self.channels[pos] if pos in self.playable else None
+            record = channels[pos]
+            streams = streams_map.get(record.id) if positions_by_id.get(record.id) == pos else None
+            after = record if streams and any(stream.url for stream in streams) else None
+            if before is not None:
+                new.playable.discard(pos)
+                new._count(before, -1)
+            if after is not None:
+                new.playable.add(pos)
+                new._count(after, 1)
+            else:
+                # Keep unplayable channels' filter values listed, as a full build does
+                new._count(record, 0)
+            if before is not after and not (before and after and before.name == after.name):
+                prefix_changes.append((pos, before, after))
+        new.prefixes = self.prefixes.patched(prefix_changes) if prefix_changes else self.prefixes
+        # Values no channel carries any more are not listed, as in a full build
+        new.category_counts = {
+            category: count for category, count in new.category_counts.items()
+            if count or category in new.facets._by_category
+        }
+        new.country_counts = {
+            code: count for code, count in new.country_counts.items()
+            if count or code in countries or code in new.facets._by_country
+        }
+        new._set_vocabularies()
+
+        stats = {
+            "added": added,
+            "removed": removed,
+            "changed": len(changes) - added - removed,
+            "streams_changed": streams_changed,
+        }
+        return new, stats
+
+    def _count(self, channel: ChannelRecord, delta: int) -> None:
+        if channel.country:
+            self.country_counts[channel.country] = self.country_counts.get(channel.country, 0) + delta
+        for category in channel.categories:
+            if category:
+                self.category_counts[category] = self.category_counts.get(category, 0) + delta
+
+    def channel_name(self, pos: int) -> str:
+        """Name of the channel at `pos` (cheaper than a full record on mapped catalogs)."""
+        return self.channels[pos].name
+
+    def related(self, pos: int, k: int) -> List[int]:
+        """
+        Positions of up to `k` playable channels related to the one at `pos`.
+
+        Candidates share the country or a category, or have a similar name.
+        They are scored on name similarity (trigrams), category overlap
+        (Jaccard) and same country. The neighbour list is computed on first
+        request and memoized for this catalog version.
+        """
+        neighbours = self._related.get(pos)
+        if neighbours is None:
+            neighbours = self._compute_related(pos)
+            self._related[pos] = neighbours
+        return neighbours[:k]
+
+    def _compute_related(self, pos: int) -> List[int]:
+        channel = self.channels[pos]
+        scores: Dict[int, float] = {}
+
+        for other, similarity in self.trigrams.search(channel.name.lower(), threshold=0.2):
+            scores[other] = 3.0 * similarity
+
+        categories = set(channel.categories)
+        category_neighbours: Set[int] = set()
+        for category in categories:
+            category_neighbours.update(self.facets.category_positions(category))
+        for other in category_neighbours:
+            other_categories = self.channels[other].categories
+            overlap = len(categories.intersection(other_categories)) / len(categories.union(other_categories))
+            scores[other] = scores.get(other, 0.0) + 1.5 * overlap
+
+        for other in self.facets.code_positions(channel.country):
+            scores[other] = scores.get(other, 0.0) + 1.0
+
+        scores.pop(pos, None)
+        ranked = sorted(
+            (other for other in scores if other in self.playable),
+            key=lambda other: (-scores[other], other),
+        )
+        return ranked[:_MAX_RELATED]
@@ -1,98 +1,643 @@
 """
 Video module: search IPTV TV channels using the IPTV-org API.
 """
-from typing import List, Dict, Optional
-import requests
+import base64
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Dict, Optional, Tuple
+
+from . import catalog_file, catalog_store, stream_probe
+from .cache import LRUCache
+from .singleflight import SingleFlight
+from .video_index import (
+    Catalog,
+    ChannelRecord,
+    StreamRecord,
+    channels_from_json,
+    streams_from_json,
+)
 
 IPTV_CHANNELS_URL = "https://iptv-org.github.io/api/channels.json"
 IPTV_STREAMS_URL = "https://iptv-org.github.io/api/streams.json"
 IPTV_COUNTRIES_URL = "https://iptv-org.github.io/api/countries.json"
 
-# Cache for data
+# Probe channels with several streams in the background to play the best one
+PROBE_STREAMS = os.environ.get("IPTV_PROBE_STREAMS", "1") == "1"
+# Re-check the feeds this often in a long-running process (seconds, 0 = never)
+REFRESH_INTERVAL = int(os.environ.get("IPTV_REFRESH_INTERVAL", "3600"))
+# Max seconds a request waits for a feed load another thread already started
+LOAD_WAIT_TIMEOUT = float(os.environ.get("IPTV_LOAD_WAIT_TIMEOUT", "45"))
+# Number of search result pages kept in the LRU cache (0 disables it)
+RESULT_CACHE_SIZE = int(os.environ.get("IPTV_RESULT_CACHE_SIZE", "256"))
+# Share one memory-mapped catalog file between worker processes (gunicorn -w N)
+SHARED_CATALOG = os.environ.get("IPTV_SHARED_CATALOG", "0") == "1"
+# How often a worker checks whether another one wrote a newer catalog file (seconds)
+SHARED_CHECK_INTERVAL = float(os.environ.get("IPTV_SHARED_CHECK_INTERVAL", "5"))
+
+# Cache for data (channels and streams are kept as compact records, not feed dicts)
 _channels_cache = None
 _streams_cache = None
 _countries_cache = None
 _channel_stream_map = None
 
+# The catalog searches run against: one immutable version with all its indexes.
+# Refreshes build a new Catalog off to the side and replace this reference.
+_catalog: Optional[Catalog] = None
+_catalog_version = 0
+_swap_lock = threading.Lock()
+# Feed updates arrive from one revalidation thread per feed; each reads the other
+# feeds' caches, installs, then writes the caches back, so they must not interleave
+_apply_lock = threading.Lock()
+_refresher: Optional[threading.Thread] = None
+# Concurrent first requests share one in-flight load per feed instead of each downloading it
+_loads = SingleFlight()
+# Matching positions of searches, keyed on (catalog version, normalized
+# query/country/category, page); cleared whenever a new catalog version is swapped in.
+# Result dicts are rebuilt on each hit so the stream choice follows the prober.
+_result_cache = LRUCache(RESULT_CACHE_SIZE)
+_shared_checked_at = 0.0
 
-def _load_channels() -> List[Dict]:
-    """Load channels from IPTV API with caching."""
-    global _channels_cache
+FEEDS = (
+    ("channels", IPTV_CHANNELS_URL),
+    ("streams", IPTV_STREAMS_URL),
+    ("countries", IPTV_COUNTRIES_URL),
+)
+
+
+def _fetch_feed(name: str, url: str) -> Any:
+    """
+    Return a parsed feed from the on-disk snapshot if there is one, otherwise download it.
+
+    A snapshot is served immediately and revalidated with a conditional GET in
+    the background; if the feed changed, the catalog is rebuilt and swapped.
+    """
+    parse = _FEED_PARSERS[name]
+    snapshot = catalog_store.read_snapshot(name, parse)
+    if snapshot is not None:
+        data, meta = snapshot
+        if catalog_store.needs_revalidation(meta):
+            catalog_store.revalidate_async(name, url, meta, lambda data: _apply_feed_changes({name: data}), parse)
+        return data
+    return catalog_store.fetch(name, url, parse=parse)
+
+
+def _countries_to_map(countries_data: List[Dict]) -> Dict[str, str]:
+    """Convert the countries feed (list) to a dict: code -> name."""
+    return {c.get("code", ""): c.get("name", "") for c in countries_data if c.get("code")}
+
+
+def _countries_from_json(f) -> Dict[str, str]:
+    return _countries_to_map(json.load(f))
+
+
+# How each feed's JSON becomes the data we keep. Channels and streams are
+# projected into compact records item by item as the JSON is read, so the
+# full list of feed dicts is never held in memory.
+_FEED_PARSERS = {
+    "channels": channels_from_json,
+    "streams": streams_from_json,
+    "countries": _countries_from_json,
+}
+
+
+def _load_channels() -> List[ChannelRecord]:
+    """Load channels from the local snapshot or IPTV API with caching."""
     if _channels_cache is not None:
         return _channels_cache
     
     try:
-        r = requests.get(IPTV_CHANNELS_URL, timeout=30)
-        r.raise_for_status()
-        _channels_cache = r.json()
-        print(f"[videos._load_channels] Loaded {len(_channels_cache)} channels from IPTV API")
-        return _channels_cache
+        return _loads.do("channels", _fetch_channels, timeout=LOAD_WAIT_TIMEOUT)
     except Exception as exc:
         print(f"[videos._load_channels] Failed to load channels: {exc}")
         return []
 
 
-def _load_streams() -> List[Dict]:
-    """Load streams from IPTV API with caching."""
-    global _streams_cache
+def _fetch_channels() -> List[ChannelRecord]:
+    global _channels_cache
+    if _channels_cache is None:
+        _channels_cache = _fetch_feed("channels", IPTV_CHANNELS_URL)
+        print(f"[videos._load_channels] Loaded {len(_channels_cache)} channels from IPTV API")
+    return _channels_cache
+
+
+def _load_streams() -> List[StreamRecord]:
+    """Load streams from the local snapshot or IPTV API with caching."""
     if _streams_cache is not None:
         return _streams_cache
     
     try:
-        r = requests.get(IPTV_STREAMS_URL, timeout=30)
-        r.raise_for_status()
-        _streams_cache = r.json()
-        print(f"[videos._load_streams] Loaded {len(_streams_cache)} streams from IPTV API")
-        return _streams_cache
+        return _loads.do("streams", _fetch_streams, timeout=LOAD_WAIT_TIMEOUT)
     except Exception as exc:
         print(f"[videos._load_streams] Failed to load streams: {exc}")
         return []
 
 
+def _fetch_streams() -> List[StreamRecord]:
+    global _streams_cache
+    if _streams_cache is None:
+        _streams_cache = _fetch_feed("streams", IPTV_STREAMS_URL)
+        print(f"[videos._load_streams] Loaded {len(_streams_cache)} streams from IPTV API")
+    return _streams_cache
+
+
 def _load_countries() -> Dict[str, str]:
     """Load countries mapping (code -> name) with caching."""
-    global _countries_cache
     if _countries_cache is not None:
         return _countries_cache
     
     try:
-        r = requests.get(IPTV_COUNTRIES_URL, timeout=30)
-        r.raise_for_status()
-        countries_data = r.json()
-        # Convert list to dict: code -> name
-        _countries_cache = {c.get("code", ""): c.get("name", "") for c in countries_data if c.get("code")}
-        print(f"[videos._load_countries] Loaded {len(_countries_cache)} countries from IPTV API")
-        return _countries_cache
+        return _loads.do("countries", _fetch_countries, timeout=LOAD_WAIT_TIMEOUT)
     except Exception as exc:
         print(f"[videos._load_countries] Failed to load countries: {exc}")
         return {}
 
 
-def _build_channel_stream_map() -> Dict[str, List[Dict]]:
+def _fetch_countries() -> Dict[str, str]:
+    global _countries_cache
+    if _countries_cache is None:
+        _countries_cache = _fetch_feed("countries", IPTV_COUNTRIES_URL)
+        print(f"[videos._load_countries] Loaded {len(_countries_cache)} countries from IPTV API")
+    return _countries_cache
+
+
+def _build_channel_stream_map() -> Dict[str, List[StreamRecord]]:
     """Build a map of channel_id -> list of streams."""
+    if _channel_stream_map is not None:
+        return _channel_stream_map
+    
+    try:
+        return _loads.do("stream_map", _group_loaded_streams, timeout=LOAD_WAIT_TIMEOUT)
+    except Exception as exc:
+        print(f"[videos._build_channel_stream_map] Failed to build stream map: {exc}")
+        return {}
+
+
+def _group_loaded_streams() -> Dict[str, List[StreamRecord]]:
     global _channel_stream_map
     if _channel_stream_map is not None:
         return _channel_stream_map
     
     streams = _load_streams()
-    _channel_stream_map = {}
-    
+    if not streams:
+        # Streams failed to load; don't cache an empty map so the next call retries
+        return {}
+    _channel_stream_map = _group_streams(streams)
+    print(f"[videos._build_channel_stream_map] Mapped {len(_channel_stream_map)} channels with streams")
+    _probe_alternatives(_channel_stream_map)
+    return _channel_stream_map
+
+
+def _group_streams(streams: List[StreamRecord]) -> Dict[str, List[StreamRecord]]:
+    """Group streams by channel id, keeping feed order within each channel."""
+    streams_map: Dict[str, List[StreamRecord]] = {}
     for stream in streams:
-        channel_id = stream.get("channel")
+        channel_id = stream.channel
         if channel_id:
-            if channel_id not in _channel_stream_map:
-                _channel_stream_map[channel_id] = []
-            _channel_stream_map[channel_id].append(stream)
+            if channel_id not in streams_map:
+                streams_map[channel_id] = []
+            streams_map[channel_id].append(stream)
+    return streams_map
+
+
+def _probe_alternatives(streams_map: Dict[str, List[StreamRecord]]) -> None:
+    """Start a background health check of channels that have more than one stream."""
+    if PROBE_STREAMS:
+        # Only channels with alternatives benefit from knowing which stream is alive
+        stream_probe.start_background_probe(
+            stream.url for channel_streams in streams_map.values() if len(channel_streams) > 1
+            for stream in channel_streams
+        )
+
+
+def _best_stream(streams: List[StreamRecord]) -> Optional[StreamRecord]:
+    """
+    Pick the stream to play for a channel.
+
+    Probed live streams come first (fastest first), then streams that were
+    never probed, then streams that failed their last probe. Ties keep the
+    feed order, so without probe data this is the first stream with a URL.
+    """
+    best, best_key = None, None
+    for order, stream in enumerate(streams):
+        if not stream.url:
+            continue
+        health = stream_probe.get_health(stream.url)
+        if health is None:
+            key = (1, 0.0, order)
+        elif health["alive"]:
+            key = (0, health["latency"] or 0.0, order)
+        else:
+            key = (2, 0.0, order)
+        if best_key is None or key < best_key:
+            best, best_key = stream, key
+    return best
+
+
+def _load_catalog() -> Tuple[List[ChannelRecord], Dict[str, List[StreamRecord]], Dict[str, str]]:
+    """
+    Load channels, the channel -> streams map and countries.
+
+    The three feeds are fetched concurrently, so a cold load costs roughly the
+    slowest single download instead of the sum of all three. Each loader keeps
+    its own failure handling: a feed that fails comes back empty without
+    affecting the others, and is retried on the next call.
+    """
+    if _channels_cache is not None and _channel_stream_map is not None and _countries_cache is not None:
+        return _channels_cache, _channel_stream_map, _countries_cache
+
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="iptv-load") as pool:
+        channels_future = pool.submit(_load_channels)
+        streams_future = pool.submit(_build_channel_stream_map)
+        countries_future = pool.submit(_load_countries)
+        return channels_future.result(), streams_future.result(), countries_future.result()
+
+
+def _install_catalog(
+    channels: List[ChannelRecord],
+    streams_map: Dict[str, List[StreamRecord]],
+    countries_map: Dict[str, str],
+    incremental: bool = False,
+) -> Catalog:
+    """
+    Build a new catalog version with all its indexes and swap it in.
+
+    The build happens before the swap, so requests keep searching the previous
+    version until the new one is complete.
+
+    Args:
+        incremental: Derive the new version from the current one by diffing
+            channels by id, so only changed entries are re-indexed. Falls
+            back to a full build when the catalog can't be patched.
+    """
+    global _catalog, _catalog_version
+    with _swap_lock:
+        started = time.perf_counter()
+        version = _catalog_version + 1
+        patched = None
+        if incremental and _catalog is not None:
+            patched = _catalog.patched(channels, streams_map, countries_map, version)
+        if patched is not None:
+            catalog, diff = patched
+        else:
+            catalog = Catalog(channels, streams_map, countries_map, version)
+        if SHARED_CATALOG:
+            catalog = _publish_shared_catalog(catalog)
+        _catalog_version = catalog.version
+        _catalog = catalog
+        _result_cache.clear()
+    elapsed = time.perf_counter() - started
+    if patched is not None:
+        print(
+            f"[videos._install_catalog] Catalog v{catalog.version} patched: {diff['added']} added, "
+            f"{diff['removed']} removed, {diff['changed']} changed, "
+            f"{diff['streams_changed']} stream lists changed in {elapsed:.3f}s"
+        )
+    else:
+        shared = f", shared via {catalog.path}" if isinstance(catalog, catalog_file.MappedCatalog) else ""
+        print(
+            f"[videos._install_catalog] Catalog v{catalog.version}: {len(channels)} channels, "
+            f"{len(catalog.tokens)} name tokens, built in {elapsed:.2f}s{shared}"
+        )
+    _start_refresher()
+    return catalog
+
+
+def _shared_catalog_path():
+    return catalog_store.SNAPSHOT_DIR / "catalog.bin"
+
+
+def _feed_sources() -> Dict[str, List]:
+    """Validators of the feed snapshots, recorded in the shared file to detect stale copies."""
+    sources = {}
+    for name, _url in FEEDS:
+        meta = catalog_store.read_meta(name)
+        sources[name] = [meta.get("etag"), meta.get("fetched_at")]
+    return sources
+
+
+def _publish_shared_catalog(catalog: Catalog) -> Catalog:
+    """Write a freshly built catalog to the shared file and return the mapped copy."""
+    path = _shared_catalog_path()
+    try:
+        catalog_store.SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        size = catalog_file.write_catalog(path, catalog, _feed_sources())
+    except OSError as exc:
+        print(f"[videos._publish_shared_catalog] Could not write {path}, keeping the catalog in memory: {exc}")
+        return catalog
+    print(f"[videos._publish_shared_catalog] Wrote {path} ({size / 1e6:.1f} MB)")
+    return catalog_file.open_catalog(path, catalog.version) or catalog
+
+
+def _open_shared_catalog() -> Optional[Catalog]:
+    """
+    Map the shared catalog file and swap it in, if it was built from the current snapshots.
+
+    Returns:
+        The mapped catalog, or None if there is no usable file.
+    """
+    global _catalog, _catalog_version
+    path = _shared_catalog_path()
+    with _swap_lock:
+        catalog = catalog_file.open_catalog(path, _catalog_version + 1, _feed_sources())
+        if catalog is None:
+            return None
+        _catalog_version = catalog.version
+        _catalog = catalog
+        _result_cache.clear()
+    print(f"[videos._open_shared_catalog] Mapped catalog v{catalog.version}: {len(catalog.channels)} channels from {path}")
     
-    print(f"[videos._build_channel_stream_map] Mapped {len(_channel_stream_map)} channels with streams")
-    return _channel_stream_map
+    # This path skips _fetch_feed, so start the snapshot revalidation here
+    for name, url in FEEDS:
+        meta = catalog_store.read_meta(name)
+        if meta and catalog_store.needs_revalidation(meta):
+            catalog_store.revalidate_async(
+                name, url, meta, lambda data, name=name: _apply_feed_changes({name: data}), _FEED_PARSERS[name]
+            )
+    _start_refresher()
+    return catalog
+
+
+def _check_shared_catalog(catalog: Catalog) -> Catalog:
+    """Remap the shared file if another worker replaced it (checked every SHARED_CHECK_INTERVAL)."""
+    global _shared_checked_at
+    now = time.monotonic()
+    if now - _shared_checked_at < SHARED_CHECK_INTERVAL:
+        return catalog
+    _shared_checked_at = now
+    if catalog_file.file_id(_shared_catalog_path()) == getattr(catalog, "file_id", None):
+        return catalog
+    return _open_shared_catalog() or catalog
+
+
+def _release_feed_caches() -> None:
+    """
+    Drop this worker's parsed feeds once the catalog lives in the shared file.
+
+    They are re-read from the snapshots if a refresh needs them again.
+    """
+    global _channels_cache, _streams_cache, _channel_stream_map
+    if isinstance(_catalog, catalog_file.MappedCatalog):
+        _channels_cache = _streams_cache = _channel_stream_map = None
+
+
+def _get_catalog() -> Optional[Catalog]:
+    """
+    Return the current catalog, loading and indexing the feeds on first use.
+
+    Concurrent first callers wait (up to LOAD_WAIT_TIMEOUT) for a single load.
+    With SHARED_CATALOG, a current catalog file written by another worker is
+    mapped instead of loading the feeds.
+    """
+    catalog = _catalog
+    if catalog is not None:
+        return _check_shared_catalog(catalog) if SHARED_CATALOG else catalog
+    
+    try:
+        return _loads.do("catalog", _load_and_install_catalog, timeout=LOAD_WAIT_TIMEOUT)
+    except TimeoutError as exc:
+        print(f"[videos._get_catalog] {exc}")
+        return None
+
+
+def _load_and_install_catalog() -> Optional[Catalog]:
+    if _catalog is not None:
+        return _catalog
+    # Feed changes that land during the first build (a snapshot revalidated in
+    # the background) wait for it and patch the catalog it installs, rather
+    # than updating the caches after this build read them
+    with _apply_lock:
+        if _catalog is not None:
+            return _catalog
+        if not SHARED_CATALOG:
+            return _build_and_install_catalog()
+        
+        # One worker builds the shared file; the others wait for it and map it
+        with catalog_file.build_lock(_shared_catalog_path()):
+            catalog = _open_shared_catalog() or _build_and_install_catalog()
+    _release_feed_caches()
+    return catalog
+
+
+def _build_and_install_catalog() -> Optional[Catalog]:
+    channels, streams_map, countries_map = _load_catalog()
+    if not channels or not streams_map:
+        # Nothing playable (a feed failed); don't cache, the next call retries
+        return None
+    return _install_catalog(channels, streams_map, countries_map)
+
+
+def _apply_feed_changes(changed: Dict[str, Any]) -> None:
+    """
+    Replace the given feeds (name -> data from its _FEED_PARSERS entry) and swap in an updated catalog.
+
+    Feeds not in `changed` are reused from the current caches. The new catalog
+    is patched from the current one, so the cost follows the number of changed
+    channels rather than the size of the catalog. A mapped shared catalog
+    can't be patched; it is rebuilt and the file rewritten instead.
+    """
+    with _apply_lock:
+        if SHARED_CATALOG:
+            # Another worker may be rebuilding the shared file from the same change
+            with catalog_file.build_lock(_shared_catalog_path()):
+                _apply_feed_changes_locked(changed)
+            _release_feed_caches()
+        else:
+            _apply_feed_changes_locked(changed)
+    print(f"[videos._apply_feed_changes] Applied new {', '.join(sorted(changed))} feed(s)")
+
+
+def _apply_feed_changes_locked(changed: Dict[str, Any]) -> None:
+    global _channels_cache, _streams_cache, _countries_cache, _channel_stream_map
+    if SHARED_CATALOG and catalog_file.file_id(_shared_catalog_path()) != getattr(_catalog, "file_id", None):
+        # Another worker may already have published a catalog built from these snapshots
+        if _open_shared_catalog() is not None:
+            return
+    
+    # Unchanged feeds come from the caches (or the snapshots, if the caches were released)
+    channels = changed["channels"] if "channels" in changed else _load_channels()
+    streams = changed["streams"] if "streams" in changed else _load_streams()
+    countries_map = changed["countries"] if "countries" in changed else _load_countries()
+    streams_map = _group_streams(streams) if "streams" in changed and streams else _build_channel_stream_map()
+    
+    if channels and streams_map and _catalog is not None:
+        _install_catalog(channels, streams_map, countries_map or {}, incremental=True)
+    _channels_cache, _streams_cache, _countries_cache = channels, streams, countries_map
+    _channel_stream_map = streams_map
+    if "streams" in changed and streams_map:
+        _probe_alternatives(streams_map)
+
+
+def refresh_catalog() -> bool:
+    """
+    Re-check all feeds with conditional GETs and swap in a new catalog if any changed.
+
+    Returns:
+        True if at least one feed changed.
+    """
+    def refetch(name: str, url: str) -> Any:
+        return catalog_store.fetch(name, url, catalog_store.read_meta(name), parse=_FEED_PARSERS[name])
+
+    changed: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="iptv-refresh") as pool:
+        futures = {name: pool.submit(refetch, name, url) for name, url in FEEDS}
+        for name, future in futures.items():
+            try:
+                data = future.result()
+            except Exception as exc:
+                print(f"[videos.refresh_catalog] Failed to refresh {name}: {exc}")
+                continue
+            if data is not None:
+                changed[name] = data
+    
+    if changed:
+        _apply_feed_changes(changed)
+    return bool(changed)
+
+
+def _refresh_loop() -> None:
+    while True:
+        time.sleep(REFRESH_INTERVAL)
+        try:
+            refresh_catalog()
+        except Exception as exc:
+            print(f"[videos._refresh_loop] Catalog refresh failed: {exc}")
+
+
+def _start_refresher() -> None:
+    """Start the periodic background refresh (once per process)."""
+    global _refresher
+    if REFRESH_INTERVAL <= 0 or _refresher is not None:
+        return
+    _refresher = threading.Thread(target=_refresh_loop, name="iptv-refresh", daemon=True)
+    _refresher.start()
+
+
+def _narrow(positions: Optional[List[int]], allowed: List[int]) -> List[int]:
+    """Intersect sorted position lists; None stands for "every channel"."""
+    if positions is None:
+        return allowed
+    if len(allowed) < len(positions):
+        positions, allowed = allowed, positions
+    keep = set(allowed)
+    return [pos for pos in positions if pos in keep]
+
+
+def _normalize(value: Optional[str]) -> str:
+    """Lowercase and strip a query/filter string (None -> "")."""
+    return value.lower().strip() if value else ""
+
+
+def _iter_matches(
+    catalog: Catalog,
+    query_lower: str,
+    country_lower: str,
+    category_lower: str,
+    start: int = 0,
+) -> Iterator[int]:
+    """
+    Yield positions of playable channels matching the (normalized) filters.
+
+    Positions come out in catalog order, beginning at `start`, and are
+    produced lazily so callers can stop as soon as they have enough.
+    """
+    # Narrow the catalog with the indexes: facets for country/category, the
+    # name index for text queries. The name index over-approximates, so the
+    # substring check below still runs on its candidates.
+    channels = catalog.channels
+    positions: Optional[List[int]] = None
+    if country_lower:
+        positions = _narrow(positions, catalog.facets.country_positions(country_lower))
+    if category_lower:
+        positions = _narrow(positions, catalog.facets.category_positions(category_lower))
+    if query_lower:
+        token_positions = catalog.tokens.candidates(query_lower)
+        if token_positions is not None:
+            positions = _narrow(positions, token_positions)
+
+    if positions is None:
+        candidates: Iterable[int] = range(start, len(channels))
+    else:
+        candidates = islice(positions, bisect_left(positions, start), None)
+
+    playable = catalog.playable
+    for pos in candidates:
+        # Skip if no playable stream is available for this channel
+        if pos not in playable:
+            continue
+        
+        # Query filtering (search in name)
+        if query_lower and query_lower not in catalog.channel_name(pos).lower():
+            continue
+        
+        yield pos
+
+
+def _iter_fuzzy_matches(catalog: Catalog, query_lower: str, country_lower: str, category_lower: str) -> Iterator[int]:
+    """Yield positions of playable channels similar to the query, best match first."""
+    allowed = None
+    if country_lower:
+        allowed = set(catalog.facets.country_positions(country_lower))
+    if category_lower:
+        category_positions = catalog.facets.category_positions(category_lower)
+        allowed = set(category_positions) if allowed is None else allowed.intersection(category_positions)
+
+    for pos, _score in catalog.trigrams.search(query_lower):
+        if pos in catalog.playable and (allowed is None or pos in allowed):
+            yield pos
+
+
+def _channel_result(
+    channel: ChannelRecord,
+    streams_map: Dict[str, List[StreamRecord]],
+    countries_map: Dict[str, str],
+) -> Dict:
+    """Build the result dict the templates and desktop app render for a channel."""
+    # Get the best stream URL (fastest live one if the prober has checked them)
+    stream_url = _best_stream(streams_map[channel.id]).url
+    channel_country_code = channel.country
+    channel_categories = list(channel.categories)
+    
+    # Build description
+    desc_parts = []
+    if channel_country_code and channel_country_code in countries_map:
+        desc_parts.append(f"Country: {countries_map[channel_country_code]}")
+    if channel_categories:
+        desc_parts.append(f"Category: {', '.join([c.capitalize() for c in channel_categories])}")
+    description = " | ".join(desc_parts) if desc_parts else "TV Channel"
+    
+    # Get logo/thumbnail (channels.json doesn't have logo, but we can try to get it from streams)
+    logo = channel.logo
+    thumbnail = logo if logo else ""
+    
+    return {
+        "id": channel.id,
+        "title": channel.name,
+        "description": description,
+        "thumbnail": thumbnail,
+        "embed_url": stream_url,
+        "stream_url": stream_url,
+        "country": countries_map.get(channel_country_code, channel_country_code) if channel_country_code else "",
+        "country_code": channel_country_code,
+        "categories": channel_categories,
+    }
+
+
+def _results_at(catalog: Catalog, positions: Iterable[int]) -> List[Dict]:
+    """Result dicts for catalog positions. Built on every read, so the stream choice follows the latest probes."""
+    return [_channel_result(catalog.channels[pos], catalog.streams_map, catalog.countries) for pos in positions]
 
 
 def search_videos(
     query: str = "",
     max_results: int = 12,
     country: Optional[str] = None,
-    category: Optional[str] = None
+    category: Optional[str] = None,
+    fuzzy: bool = False,
 ) -> List[Dict]:
     """
     Search IPTV channels matching the given query, country, and category.
@@ -102,110 +647,309 @@ def search_videos(
         max_results: Maximum number of results to return
         country: Filter by country code (e.g., 'US', 'GB') or country name
         category: Filter by category (e.g., 'general', 'sports', 'news', 'movies')
+        fuzzy: Typo-tolerant mode: rank channels by trigram similarity of their
+            name and alt names to the query (best first) instead of requiring
+            the query as a substring of the name
     
     Returns:
         List of channel dictionaries with id, title, description, thumbnail, and stream_url.
     """
-    channels = _load_channels()
-    streams_map = _build_channel_stream_map()
-    countries_map = _load_countries()
+    catalog = _get_catalog()
     
-    if not channels:
+    if catalog is None:
         return []
     
-    query_lower = query.lower().strip() if query else ""
-    country_lower = country.lower().strip() if country else ""
-    category_lower = category.lower().strip() if category else ""
+    query_lower, country_lower, category_lower = _normalize(query), _normalize(country), _normalize(category)
+    fuzzy = fuzzy and bool(query_lower)
+    key = (catalog.version, query_lower, country_lower, category_lower, "fuzzy" if fuzzy else "list", max_results)
+    # Only the matching positions are cached; see _results_at
+    positions = _result_cache.get(key)
+    if positions is None:
+        if fuzzy:
+            matches = _iter_fuzzy_matches(catalog, query_lower, country_lower, category_lower)
+        else:
+            matches = _iter_matches(catalog, query_lower, country_lower, category_lower)
+        positions = tuple(islice(matches, max_results))
+        _result_cache.put(key, positions)
+    return _results_at(catalog, positions)
+
+
+def iter_videos(
+    query: str = "",
+    country: Optional[str] = None,
+    category: Optional[str] = None,
+) -> Iterator[Dict]:
+    """
+    Lazily yield every channel matching the search_videos filters, in catalog order.
+
+    Results are built one at a time and not cached, so walking the whole
+    catalog never holds more than one result dict.
+    """
+    catalog = _get_catalog()
+    if catalog is None:
+        return
+    for pos in _iter_matches(catalog, _normalize(query), _normalize(country), _normalize(category)):
+        yield _channel_result(catalog.channels[pos], catalog.streams_map, catalog.countries)
+
+
+def _m3u_attr(value: str) -> str:
+    return " ".join(value.replace('"', "'").split())
+
+
+def _m3u_entry(video: Dict) -> str:
+    """One #EXTINF line plus the stream URL for a search result."""
+    group = ";".join(c.capitalize() for c in video["categories"])
+    return (
+        f'#EXTINF:-1 tvg-id="{_m3u_attr(video["id"])}" tvg-name="{_m3u_attr(video["title"])}" '
+        f'tvg-logo="{_m3u_attr(video["thumbnail"])}" tvg-country="{_m3u_attr(video["country_code"])}" '
+        f'group-title="{_m3u_attr(group)}",{" ".join(video["title"].split())}\n'
+        f'{video["stream_url"].strip()}\n'
+    )
+
+
+def iter_m3u(
+    query: str = "",
+    country: Optional[str] = None,
+    category: Optional[str] = None,
+    batch_size: int = 256,
+) -> Iterator[str]:
+    """
+    Yield an extended M3U playlist of the matching channels, chunk by chunk.
+
+    Args:
+        query, country, category: Same filters as search_videos
+        batch_size: Entries per yielded chunk (fewer, larger writes)
+
+    Returns:
+        Iterator of text chunks; the first is the "#EXTM3U" header.
+    """
+    yield "#EXTM3U\n"
+    batch: List[str] = []
+    for video in iter_videos(query, country, category):
+        batch.append(_m3u_entry(video))
+        if len(batch) >= batch_size:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def _encode_cursor(channels: List[ChannelRecord], pos: int, seen: int, total: int) -> str:
+    """Cursor = last returned position + its channel id, matches returned so far, total."""
+    payload = json.dumps([pos, channels[pos].id, seen, total], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, catalog: Catalog) -> Tuple[int, int, int]:
+    """
+    Decode a cursor into (position to resume after, seen, total).
+
+    If the catalog was refreshed since the cursor was issued, the position is
+    re-resolved from the channel id so paging continues where it left off.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        pos, channel_id, seen, total = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(channel_id, str):
+            raise ValueError("channel id must be a string")
+        for number in (pos, seen, total):
+            if type(number) is not int or number < 0:
+                raise ValueError("position and counts must be non-negative integers")
+    except (TypeError, ValueError, UnicodeError) as exc:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from exc
+
+    channels = catalog.channels
+    if not (0 <= pos < len(channels) and channels[pos].id == channel_id):
+        pos = catalog.positions_by_id.get(channel_id, min(pos, len(channels) - 1))
+    return pos, seen, total
+
+
+def search_videos_page(
+    query: str = "",
+    country: Optional[str] = None,
+    category: Optional[str] = None,
+    cursor: Optional[str] = None,
+    page_size: int = 24,
+) -> Dict:
+    """
+    Paginated variant of search_videos.
     
-    results: List[Dict] = []
+    The first call (no cursor) counts every match; the count travels in the
+    cursor, so later pages resume right after the previous page's last
+    channel without re-checking earlier matches.
     
-    for channel in channels:
-        channel_id = channel.get("id", "")
-        
-        # Skip if no streams available for this channel
-        if channel_id not in streams_map or not streams_map[channel_id]:
-            continue
-        
-        # Get the first/best stream URL
-        stream = streams_map[channel_id][0]
-        stream_url = stream.get("url", "")
-        if not stream_url:
-            continue
-        
-        # Extract channel information
-        name = channel.get("name", "Unknown Channel")
-        name_lower = name.lower()
-        
-        # Country filtering
-        channel_country_code = channel.get("country", "")
-        channel_country_name = countries_map.get(channel_country_code, "").lower() if channel_country_code else ""
-        
-        if country_lower:
-            # Match by country code (exact match, case-insensitive)
-            # or by country name (contains match, case-insensitive)
-            country_match = False
-            if channel_country_code:
-                country_match = country_lower == channel_country_code.lower()
-            if not country_match and channel_country_name:
-                country_match = country_lower in channel_country_name or channel_country_name.startswith(country_lower)
-            if not country_match:
-                continue
-        
-        # Category filtering
-        channel_categories = [cat.lower() for cat in channel.get("categories", [])]
-        if category_lower:
-            if category_lower not in channel_categories:
-                continue
-        
-        # Query filtering (search in name)
-        if query_lower:
-            if query_lower not in name_lower:
-                continue
-        
-        # Build description
-        desc_parts = []
-        if channel_country_code and channel_country_code in countries_map:
-            desc_parts.append(f"Country: {countries_map[channel_country_code]}")
-        if channel_categories:
-            desc_parts.append(f"Category: {', '.join([c.capitalize() for c in channel_categories])}")
-        description = " | ".join(desc_parts) if desc_parts else "TV Channel"
-        
-        # Get logo/thumbnail (channels.json doesn't have logo, but we can try to get it from streams)
-        logo = channel.get("logo", "")
-        thumbnail = logo if logo else ""
-        
-        results.append(
-            {
-                "id": channel_id,
-                "title": name,
-                "description": description,
-                "thumbnail": thumbnail,
-                "embed_url": stream_url,
-                "stream_url": stream_url,
-                "country": countries_map.get(channel_country_code, channel_country_code) if channel_country_code else "",
-                "country_code": channel_country_code,
-                "categories": channel_categories,
-            }
-        )
-        
-        # Limit results
-        if len(results) >= max_results:
-            break
+    Args:
+        query, country, category: Same filters as search_videos
+        cursor: `next_cursor` from the previous page, or None for the first page
+        page_size: Number of channels per page
+    
+    Returns:
+        dict with "results" (list of channel dicts), "total" (number of matches)
+        and "next_cursor" (None on the last page).
+    
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    catalog = _get_catalog()
+    
+    if catalog is None:
+        return {"results": [], "total": 0, "next_cursor": None}
+    
+    query_lower, country_lower, category_lower = _normalize(query), _normalize(country), _normalize(category)
+    key = (catalog.version, query_lower, country_lower, category_lower, cursor or "", page_size)
+    cached = _result_cache.get(key)
+    if cached is not None:
+        positions, total, next_cursor = cached
+        return {"results": _results_at(catalog, positions), "total": total, "next_cursor": next_cursor}
+    
+    channels = catalog.channels
+    start, seen, total = 0, 0, None
+    if cursor:
+        after, seen, total = _decode_cursor(cursor, catalog)
+        start = after + 1
+    
+    matches = _iter_matches(catalog, query_lower, country_lower, category_lower, start)
+    page = list(islice(matches, max(page_size, 1)))
+    if total is None:
+        total = len(page) + sum(1 for _ in matches)
+    
+    seen += len(page)
+    next_cursor = None
+    if page and seen < total:
+        next_cursor = _encode_cursor(channels, page[-1], seen, total)
+    
+    # Positions only, as in search_videos
+    _result_cache.put(key, (tuple(page), total, next_cursor))
+    return {"results": _results_at(catalog, page), "total": total, "next_cursor": next_cursor}
+
+
+def get_channel(channel_id: str) -> Optional[Dict]:
+    """
+    Look up a single channel by its IPTV-org id (constant time, no search).
+    
+    Returns:
+        Channel dict (same shape as search_videos results), or None if the
+        channel is unknown or has no playable stream.
+    """
+    catalog = _get_catalog()
+    if catalog is None or not channel_id:
+        return None
+    
+    pos = catalog.positions_by_id.get(channel_id)
+    if pos is None or pos not in catalog.playable:
+        return None
+    return _channel_result(catalog.channels[pos], catalog.streams_map, catalog.countries)
+
+
+def autocomplete_channels(prefix: str, k: int = 8) -> List[Dict[str, str]]:
+    """
+    Suggest channel names for a search box as the user types.
+    
+    Channels whose name starts with the prefix come first, then channels with
+    a later word starting with it; each group is alphabetical.
     
-    return results
+    Returns:
+        Up to k {"id", "title", "country_code"} dicts.
+    """
+    catalog = _get_catalog()
+    # Keep a trailing space: "bbc " should complete to "BBC News", not "BBCX"
+    prefix_lower = prefix.lower().lstrip() if prefix else ""
+    if catalog is None or not prefix_lower:
+        return []
+    
+    suggestions = []
+    for pos in catalog.prefixes.complete(prefix_lower, k):
+        channel = catalog.channels[pos]
+        suggestions.append({"id": channel.id, "title": channel.name, "country_code": channel.country})
+    return suggestions
+
+
+def related_channels(channel_id: str, k: int = 10) -> List[Dict]:
+    """
+    Channels related to the given one: same country, shared categories, similar names.
+    
+    Works for any channel in the catalog, not just ones in the current results.
+    Neighbour lists are computed once per channel and catalog version.
+    
+    Args:
+        channel_id: IPTV-org channel id (e.g. 'CNN.us')
+        k: Maximum number of related channels to return
+    
+    Returns:
+        List of channel dicts (same shape as search_videos), best match first;
+        empty if the channel is unknown.
+    """
+    catalog = _get_catalog()
+    if catalog is None:
+        return []
+    
+    pos = catalog.positions_by_id.get(channel_id)
+    if pos is None:
+        return []
+    return [
+        _channel_result(catalog.channels[other], catalog.streams_map, catalog.countries)
+        for other in catalog.related(pos, k)
+    ]
+
 
+def get_search_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters and size of the search result cache."""
+    return _result_cache.stats()
 
-def get_available_countries() -> List[Dict[str, str]]:
-    """Get list of available countries with codes and names."""
-    countries_map = _load_countries()
-    return [{"code": code, "name": name} for code, name in sorted(countries_map.items(), key=lambda x: x[1])]
 
+def get_available_countries(min_count: int = 0, by_popularity: bool = False) -> List[Dict]:
+    """
+    Get list of available countries with codes, names and channel counts.
+    
+    The list is precomputed once per catalog version.
+    
+    Args:
+        min_count: Only include countries with at least this many playable channels
+        by_popularity: Order by channel count (descending) instead of by name
+    
+    Returns:
+        List of {"code", "name", "count"} dicts.
+    """
+    catalog = _get_catalog()
+    if catalog is None:
+        # Catalog unavailable (e.g. streams feed down): names only, no counts
+        countries_map = _load_countries()
+        return [{"code": code, "name": name, "count": 0} for code, name in sorted(countries_map.items(), key=lambda x: x[1])]
+    
+    counts = catalog.country_counts
+    countries = [
+        {"code": code, "name": name, "count": counts.get(code, 0)}
+        for code, name in catalog.countries_by_name
+        if counts.get(code, 0) >= min_count
+    ]
+    if by_popularity:
+        countries.sort(key=lambda c: -c["count"])
+    return countries
+
+
+def get_available_categories(min_count: int = 0, by_popularity: bool = False) -> List[str]:
+    """
+    Get list of available categories.
+    
+    Args:
+        min_count: Only include categories with at least this many playable channels
+        by_popularity: Order by channel count (descending) instead of alphabetically
+    """
+    catalog = _get_catalog()
+    if catalog is None:
+        return []
+    
+    counts = catalog.category_counts
+    categories = [c for c in catalog.categories_by_name if counts[c] >= min_count]
+    if by_popularity:
+        categories.sort(key=lambda c: -counts[c])
+    return categories
 
-def get_available_categories() -> List[str]:
-    """Get list of available categories."""
-    channels = _load_channels()
-    categories = set()
-    for channel in channels:
-        categories.update(channel.get("categories", []))
-    return sorted([c for c in categories if c])
 
+def get_category_counts() -> Dict[str, int]:
+    """Number of playable channels per category (precomputed per catalog version)."""
+    catalog = _get_catalog()
+    return dict(catalog.category_counts) if catalog is not None else {}
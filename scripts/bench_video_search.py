@@ -0,0 +1,227 @@
+"""
+Benchmark the video catalog load and search path on synthetic feeds.
+
+For each scale, synthetic channels/streams/countries feeds are written as
+on-disk snapshots, then the real loaders run against them (no network):
+feed parsing, the channel -> streams map, the catalog/index build, and a
+fixed mix of searches. Results are printed as JSON so runs can be diffed
+across commits; progress and module logs go to stderr.
+
+Usage:
+    python scripts/bench_video_search.py                          # 10k, 100k, 1m
+    python scripts/bench_video_search.py --scales 10k --repeat 20
+    python scripts/bench_video_search.py --output bench-$(git rev-parse --short HEAD).json
+"""
+import argparse
+import contextlib
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from modules import catalog_file, catalog_store, stream_probe, videos  # noqa: E402
+import synthetic_catalog  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (label, search_videos keyword arguments)
+QUERY_MIX = [
+    ("empty", {}),
+    ("country_code", {"country": "US"}),
+    ("country_name", {"country": "united"}),
+    ("category", {"category": "news"}),
+    ("country_category", {"country": "FR", "category": "sports"}),
+    ("text_common", {"query": "tv"}),
+    ("text_word", {"query": "news"}),
+    ("text_substring", {"query": "ation"}),
+    ("text_multiword", {"query": "world news"}),
+    ("text_filtered", {"query": "sport", "country": "UK"}),
+    ("text_miss", {"query": "zzzz"}),
+    ("fuzzy", {"query": "internatonal", "fuzzy": True}),
+]
+
+
+def parse_scale(value: str) -> int:
+    """'10k' -> 10000, '1m' -> 1000000, '2500' -> 2500."""
+    value = value.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def summarize(samples):
+    """Min/median/p95 of a list of durations, in milliseconds."""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+    }
+
+
+def write_feeds(channel_count: int, stream_count: int, seed: int) -> None:
+    """Write synthetic feeds as fresh snapshots into catalog_store.SNAPSHOT_DIR."""
+    snapshot_dir = catalog_store.SNAPSHOT_DIR
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    refs = []
+
+    def channels():
+        for channel in synthetic_catalog.iter_channels(channel_count, seed):
+            refs.append({"id": channel["id"], "name": channel["name"]})
+            yield channel
+
+    feeds = (
+        ("channels", channels),
+        ("streams", lambda: synthetic_catalog.make_streams(refs, stream_count, seed + 1)),
+        ("countries", synthetic_catalog.make_countries),
+    )
+    now = time.time()
+    for name, items in feeds:
+        with open(snapshot_dir / f"{name}.json", "wb") as f:
+            synthetic_catalog.write_json_array(items(), f)
+        meta = {"etag": None, "last_modified": None, "fetched_at": now, "checked_at": now}
+        (snapshot_dir / f"{name}.meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+
+def reset_videos() -> None:
+    """Forget every cached feed and catalog so the next load starts cold."""
+    videos._channels_cache = None
+    videos._streams_cache = None
+    videos._countries_cache = None
+    videos._channel_stream_map = None
+    videos._catalog = None
+    videos._result_cache.clear()
+    gc.collect()
+
+
+def bench_queries(repeat: int):
+    results = {}
+    for label, kwargs in QUERY_MIX:
+        samples = []
+        for _ in range(repeat):
+            videos._result_cache.clear()
+            found, elapsed = timed(lambda: videos.search_videos(max_results=24, **kwargs))
+            samples.append(elapsed)
+        entry = {"results": len(found), "search": summarize(samples)}
+
+        if not kwargs.get("fuzzy"):
+            # First page plus the total count of matches, as the web page asks for
+            samples = []
+            for _ in range(repeat):
+                videos._result_cache.clear()
+                page, elapsed = timed(lambda: videos.search_videos_page(page_size=24, **kwargs))
+                samples.append(elapsed)
+            entry["total"] = page["total"]
+            entry["page"] = summarize(samples)
+
+        _, elapsed = timed(lambda: videos.search_videos(max_results=24, **kwargs))
+        entry["cached_ms"] = round(elapsed * 1000, 4)
+        results[label] = entry
+    return results
+
+
+def bench_scale(channel_count: int, stream_count: int, repeat: int, seed: int):
+    with tempfile.TemporaryDirectory(prefix="iptv-bench-") as tmp:
+        catalog_store.SNAPSHOT_DIR = Path(tmp)
+        _, generate_s = timed(lambda: write_feeds(channel_count, stream_count, seed))
+        feed_bytes = sum(p.stat().st_size for p in Path(tmp).glob("*.json") if not p.name.endswith(".meta.json"))
+
+        reset_videos()
+        load = {}
+        channels, load["channels_s"] = timed(videos._load_channels)
+        streams, load["streams_s"] = timed(videos._load_streams)
+        countries, load["countries_s"] = timed(videos._load_countries)
+        streams_map, load["stream_map_s"] = timed(videos._build_channel_stream_map)
+        catalog, load["catalog_build_s"] = timed(lambda: videos._install_catalog(channels, streams_map, countries))
+        # Shared catalog file (IPTV_SHARED_CATALOG): one write, then a near-free open per worker
+        shared_path = Path(tmp) / "catalog.bin"
+        shared_bytes, load["shared_write_s"] = timed(lambda: catalog_file.write_catalog(shared_path, catalog))
+        _, load["shared_open_s"] = timed(lambda: catalog_file.open_catalog(shared_path, catalog.version))
+        load = {key: round(value, 4) for key, value in load.items()}
+
+        result = {
+            "channels": len(channels),
+            "streams": len(streams),
+            "playable_channels": len(catalog.playable),
+            "feed_mb": round(feed_bytes / 1e6, 1),
+            "shared_file_mb": round(shared_bytes / 1e6, 1),
+            "generate_s": round(generate_s, 2),
+            "load": load,
+            "queries": bench_queries(repeat),
+        }
+        if resource is not None:
+            # Peak for the whole process so far (scales run smallest first)
+            result["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+        del channels, streams, countries, streams_map, catalog
+        reset_videos()
+        return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="10k,100k,1m", help="comma-separated channel counts (k/m suffixes)")
+    parser.add_argument("--stream-ratio", type=float, default=0.3, help="streams per channel (real feeds: ~0.3)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per query")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    # Keep the run offline and free of background work
+    videos.PROBE_STREAMS = False
+    videos.REFRESH_INTERVAL = 0
+    catalog_store.REVALIDATE_AFTER = float("inf")
+    stream_probe._health = {}
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": vars(args),
+        },
+        "results": [],
+    }
+    for scale in sorted(parse_scale(s) for s in args.scales.split(",") if s.strip()):
+        print(f"Benchmarking {scale} channels...", file=sys.stderr)
+        with contextlib.redirect_stdout(sys.stderr):
+            result = bench_scale(scale, int(scale * args.stream_ratio), max(args.repeat, 1), args.seed)
+        report["results"].append(result)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Measure how much memory the IPTV catalog takes per worker.
+
+Compares the raw parsed feeds (lists of dicts, as the video module used to
+keep them) with the compact ChannelRecord/StreamRecord catalog, and the peak
+memory of building that catalog from a full json.loads versus parsing the
+feeds incrementally.
+
+Usage:
+    python scripts/measure_catalog_memory.py                  # synthetic feeds
+    python scripts/measure_catalog_memory.py --channels 40000 --streams 12000
+    python scripts/measure_catalog_memory.py --snapshot       # real feeds from .iptv_snapshot/
+"""
+import argparse
+import gc
+import io
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from modules import catalog_store  # noqa: E402
+from modules.video_index import (  # noqa: E402
+    channels_from_feed,
+    channels_from_json,
+    streams_from_feed,
+    streams_from_json,
+)
+import synthetic_catalog  # noqa: E402
+
+
+def load_bodies(args):
+    """Return the channels and streams feeds as raw JSON bytes."""
+    if args.snapshot:
+        bodies = []
+        for name in ("channels", "streams"):
+            path = catalog_store.SNAPSHOT_DIR / f"{name}.json"
+            if not path.exists():
+                sys.exit(f"No snapshot at {path}; run the app once or drop --snapshot")
+            bodies.append(path.read_bytes())
+        return bodies
+    channels = synthetic_catalog.make_channels(args.channels)
+    streams = synthetic_catalog.make_streams(channels, args.streams)
+    return json.dumps(channels).encode(), json.dumps(streams).encode()
+
+
+def measure(build):
+    """Return (object, bytes still allocated after build(), peak bytes during build())."""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=40000)
+    parser.add_argument("--streams", type=int, default=12000)
+    parser.add_argument("--snapshot", action="store_true", help="use the on-disk feed snapshots")
+    args = parser.parse_args()
+
+    channels_body, streams_body = load_bodies(args)
+
+    raw, raw_size, _ = measure(lambda: (json.loads(channels_body), json.loads(streams_body)))
+    print(f"Feeds: {len(raw[0])} channels, {len(raw[1])} streams")
+    del raw
+
+    compact, compact_size, loads_peak = measure(
+        lambda: (channels_from_feed(json.loads(channels_body)), streams_from_feed(json.loads(streams_body)))
+    )
+    del compact
+    _compact, _, stream_peak = measure(
+        lambda: (channels_from_json(io.BytesIO(channels_body)), streams_from_json(io.BytesIO(streams_body)))
+    )
+
+    print(f"Raw feed dicts:   {raw_size / 1e6:8.1f} MB")
+    print(f"Compact records:  {compact_size / 1e6:8.1f} MB")
+    print(f"Reduction:        {raw_size / max(compact_size, 1):8.1f}x")
+    print(f"Peak, json.loads: {loads_peak / 1e6:8.1f} MB")
+    print(f"Peak, streamed:   {stream_peak / 1e6:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Synthetic IPTV-org feeds for measuring the video module offline.
+
+The records follow the shape of channels.json / streams.json / countries.json
+from https://iptv-org.github.io/api, including the fields we never read, so
+memory and parse numbers are close to the real feeds.
+"""
+import json
+import random
+from typing import Dict, IO, Iterable, Iterator, List
+
+COUNTRIES = [
+    ("US", "United States"), ("UK", "United Kingdom"), ("FR", "France"), ("DE", "Germany"),
+    ("ES", "Spain"), ("IT", "Italy"), ("PH", "Philippines"), ("IN", "India"), ("BR", "Brazil"),
+    ("MX", "Mexico"), ("CA", "Canada"), ("AU", "Australia"), ("JP", "Japan"), ("KR", "South Korea"),
+    ("CN", "China"), ("RU", "Russia"), ("TR", "Turkey"), ("AR", "Argentina"), ("NG", "Nigeria"),
+    ("EG", "Egypt"), ("ID", "Indonesia"), ("PK", "Pakistan"), ("SA", "Saudi Arabia"), ("NL", "Netherlands"),
+]
+
+CATEGORIES = [
+    "general", "news", "sports", "movies", "music", "kids", "entertainment", "documentary",
+    "religious", "lifestyle", "education", "business", "comedy", "series", "culture", "cooking",
+]
+
+WORDS = [
+    "TV", "News", "Sports", "Channel", "One", "Plus", "Cinema", "Music", "Kids", "Radio", "Live",
+    "World", "Sat", "HD", "International", "Nation", "Star", "Gold", "Max", "Life", "Family",
+    "Action", "Classic", "24", "Prime", "Central", "Metro", "City", "Global", "Euro", "Latino",
+]
+
+QUALITIES = ["1080p", "720p", "576p", "480p", "360p", None]
+
+
+def make_countries() -> List[Dict]:
+    return [
+        {"name": name, "code": code, "languages": ["eng"], "flag": ""}
+        for code, name in COUNTRIES
+    ]
+
+
+def make_channels(count: int, seed: int = 1) -> List[Dict]:
+    """Generate `count` channels.json-style entries with unique ids."""
+    return list(iter_channels(count, seed))
+
+
+def iter_channels(count: int, seed: int = 1) -> Iterator[Dict]:
+    """Like make_channels, one entry at a time (same entries for the same seed)."""
+    rng = random.Random(seed)
+    for i in range(count):
+        code, _ = rng.choice(COUNTRIES)
+        name = " ".join(rng.sample(WORDS, rng.randint(1, 3)))
+        if rng.random() < 0.5:
+            name = f"{name} {i}"
+        channel_id = f"{name.replace(' ', '')}{i}.{code.lower()}"
+        yield (
+            {
+                "id": channel_id,
+                "name": name,
+                "alt_names": [f"{name} Alt"] if rng.random() < 0.2 else [],
+                "network": rng.choice([None, "Global Media", "Star Network"]),
+                "owners": [rng.choice(["Acme Broadcasting", "Public Media Corp"])],
+                "country": code,
+                "subdivision": None,
+                "city": rng.choice([None, "Capital City"]),
+                "categories": rng.sample(CATEGORIES, rng.randint(0, 2)),
+                "is_nsfw": False,
+                "launched": rng.choice([None, "1999-01-01"]),
+                "closed": None,
+                "replaced_by": None,
+                "website": f"https://www.{channel_id.lower()}.example/",
+                "logo": f"https://i.imgur.com/{channel_id}.png",
+            }
+        )
+
+
+def make_streams(channels: List[Dict], count: int, seed: int = 2) -> List[Dict]:
+    """Generate `count` streams.json-style entries pointing at random channels."""
+    rng = random.Random(seed)
+    streams = []
+    for i in range(count):
+        channel = rng.choice(channels)
+        streams.append(
+            {
+                "channel": channel["id"],
+                "feed": rng.choice([None, "SD", "HD"]),
+                "title": channel["name"],
+                "url": f"https://live.example-cdn{i % 50}.net/{channel['id']}/{i}/index.m3u8",
+                "referrer": None,
+                "user_agent": None,
+                "quality": rng.choice(QUALITIES),
+            }
+        )
+    return streams
+
+
+def write_json_array(items: Iterable[Dict], f: IO[bytes]) -> None:
+    """Write items as a JSON array without building the whole document in memory."""
+    f.write(b"[")
+    for i, item in enumerate(items):
+        if i:
+            f.write(b",")
+        f.write(json.dumps(item).encode("utf-8"))
+    f.write(b"]")
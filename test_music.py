@@ -0,0 +1,336 @@
+"""
+Tests for the music module.
+Runs against a local stand-in for the Deezer API, so no network access is needed.
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+# Ensure the project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from modules import music, track_index
+from modules.cache import TTLCache
+
+
+def make_track(i, query="song"):
+    return {
+        "id": i,
+        "title": f"{query.title()} {i}",
+        "link": f"https://www.deezer.com/track/{i}",
+        "preview": f"https://cdn.example/preview/{i}.mp3",
+        "artist": {"name": f"Artist {i % 3}"},
+        "album": {"title": f"Album {i % 5}", "cover_medium": f"https://cdn.example/cover/{i}.jpg"},
+    }
+
+
+class DeezerHandler(BaseHTTPRequestHandler):
+    """Stand-in for api.deezer.com/search; keeps connections alive and records who asked what."""
+
+    protocol_version = "HTTP/1.1"
+    total = 30
+    delay = 0.0
+    requests_seen = []
+    client_ports = set()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.requests_seen.append((url.path, params))
+        self.client_ports.add(self.client_address[1])
+        time.sleep(self.delay)
+        if url.path != "/search":
+            body = {"error": {"type": "DataException", "message": "no data", "code": 800}}
+        else:
+            query = params.get("q", "")
+            index, limit = int(params.get("index", 0)), int(params.get("limit", 25))
+            end = min(index + limit, self.total)
+            body = {"data": [make_track(i, query) for i in range(index, end)], "total": self.total}
+            if end < self.total:
+                body["next"] = f"https://api.deezer.com/search?q={query}&limit={limit}&index={end}"
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_deezer(monkeypatch):
+    """Start the stand-in API and point the shared music client at it; returns the server."""
+    DeezerHandler.requests_seen = []
+    DeezerHandler.client_ports = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DeezerHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = music.DeezerClient(f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(music, "_client", client)
+    monkeypatch.setattr(music, "_search_cache", search_cache())
+    monkeypatch.setattr(music, "LOCAL_INDEX", False)
+    monkeypatch.setattr(music, "_refresh_stats", {"refreshes": 0, "refresh_errors": 0})
+    return server
+
+
+def search_cache(**kwargs):
+    """A fresh page cache configured like music._search_cache."""
+    kwargs.setdefault("max_entry_size", 100)
+    return TTLCache(64, sizeof=lambda page: len(page[0]), **kwargs)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_search_tracks_shape(monkeypatch):
+    """Deezer items come back shaped for the music template."""
+    server = start_deezer(monkeypatch)
+    try:
+        tracks = music.search_tracks("love", limit=3)
+        assert [t["name"] for t in tracks] == ["Love 0", "Love 1", "Love 2"]
+        assert tracks[1] == {
+            "id": 1,
+            "name": "Love 1",
+            "artists": "Artist 1",
+            "album": "Album 1",
+            "image": "https://cdn.example/cover/1.jpg",
+            "preview_url": "https://cdn.example/preview/1.mp3",
+            "external_url": "https://www.deezer.com/track/1",
+        }
+        assert DeezerHandler.requests_seen[-1] == ("/search", {"q": "love", "index": "0", "limit": "3"})
+    finally:
+        server.shutdown()
+
+
+def test_searches_reuse_one_connection(monkeypatch):
+    """Sequential searches share one keep-alive connection instead of reconnecting."""
+    server = start_deezer(monkeypatch)
+    try:
+        for q in ("a", "b", "c", "d"):
+            assert len(music.search_tracks(q, limit=2)) == 2
+        assert len(DeezerHandler.requests_seen) == 4
+        assert len(DeezerHandler.client_ports) == 1
+        assert music.get_client() is music._client
+    finally:
+        server.shutdown()
+
+
+def test_search_errors_return_empty(monkeypatch):
+    """API errors (even as a 200 with an error object) and network errors give no results."""
+    server = start_deezer(monkeypatch)
+    try:
+        try:
+            music.get_client().get("nothing-here")
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+    finally:
+        server.shutdown()
+    monkeypatch.setattr(music, "_client", music.DeezerClient("http://127.0.0.1:9", timeout=0.5))
+    assert music.search_tracks("anything") == []
+
+
+def test_search_cache_stale_while_revalidate(monkeypatch):
+    """Fresh hits skip Deezer; stale hits are served at once and refreshed in the background."""
+    server = start_deezer(monkeypatch)
+    clock = FakeClock()
+    monkeypatch.setattr(music, "_search_cache", search_cache(ttl=60, stale_ttl=600, max_entry_size=5, clock=clock))
+    try:
+        first = music.search_tracks("Daft  Punk", limit=3)
+        first[0]["name"] = "changed by caller"
+        assert music.search_tracks("daft punk", limit=3)[0]["name"] == "Daft  Punk 0"
+        assert len(DeezerHandler.requests_seen) == 1
+
+        # Stale: the old tracks come back immediately, one refresh runs
+        DeezerHandler.total = 2
+        clock.now += 120
+        assert len(music.search_tracks("daft punk", limit=3)) == 3
+        assert len(music.search_tracks("daft punk", limit=3)) == 3
+        deadline = time.time() + 2
+        while music.get_search_cache_stats()["refreshes"] < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(DeezerHandler.requests_seen) == 2
+        assert len(music.search_tracks("daft punk", limit=3)) == 2  # refreshed and fresh again
+
+        # Past the stale window it is a plain miss again
+        clock.now += 1000
+        music.search_tracks("daft punk", limit=3)
+        assert len(DeezerHandler.requests_seen) == 3
+
+        # Too many tracks for one entry: served, never cached
+        DeezerHandler.total = 30
+        music.search_tracks("big", limit=10)
+        music.search_tracks("big", limit=10)
+        assert len(DeezerHandler.requests_seen) == 5
+
+        stats = music.get_search_cache_stats()
+        assert stats["hits"] == 2 and stats["stale_hits"] == 2 and stats["oversized"] == 2
+        assert stats["misses"] == 4 and stats["refreshing"] == 0
+    finally:
+        DeezerHandler.total = 30
+        server.shutdown()
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    clock = FakeClock()
+    cache = TTLCache(2, ttl=10, stale_ttl=10, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (1, TTLCache.FRESH)
+    cache.put("c", 3)
+    assert cache.get("b") == (None, None)
+    clock.now += 15
+    assert cache.get("a") == (1, TTLCache.STALE)
+    assert cache.stats()["evictions"] == 1 and len(cache) == 2
+
+
+def test_concurrent_identical_searches_share_one_call(monkeypatch):
+    """Identical concurrent searches make one Deezer call; different limits don't share it."""
+    server = start_deezer(monkeypatch)
+    DeezerHandler.delay = 0.3
+    try:
+        results = []
+        threads = [
+            threading.Thread(target=lambda q=q: results.append(music.search_tracks(q, limit=4)))
+            for q in ["Viral Hit"] * 6 + ["viral  hit "] * 4
+        ]
+        threads.append(threading.Thread(target=lambda: results.append(music.search_tracks("viral hit", limit=2))))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert sorted(params["limit"] for _path, params in DeezerHandler.requests_seen) == ["2", "4"]
+        assert sorted(len(r) for r in results) == [2] + [4] * 10
+        shared = [r for r in results if len(r) == 4]
+        assert all(r == shared[0] for r in shared)
+        assert len({id(r) for r in shared}) == len(shared)  # each caller gets its own copy
+        assert music.get_search_cache_stats()["in_flight"] == 0
+    finally:
+        DeezerHandler.delay = 0.0
+        server.shutdown()
+
+
+def test_iter_tracks_walks_pages_lazily(monkeypatch):
+    """Pages are fetched on demand, the next one in the background, and never twice."""
+    server = start_deezer(monkeypatch)
+    DeezerHandler.total = 23
+    try:
+        tracks = music.iter_tracks("mix", page_size=10)
+        assert DeezerHandler.requests_seen == []  # nothing until the first track is asked for
+
+        first = next(tracks)
+        assert first["id"] == 0
+        deadline = time.time() + 2
+        while len(DeezerHandler.requests_seen) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        # The second page is prefetched while the first is still being consumed
+        assert [params["index"] for _path, params in DeezerHandler.requests_seen] == ["0", "10"]
+
+        rest = list(tracks)
+        assert [t["id"] for t in [first] + rest] == list(range(23))
+        assert [params["index"] for _path, params in DeezerHandler.requests_seen] == ["0", "10", "20"]
+
+        # "Load more" from the web page: the next page comes from the cache
+        page, next_index = music.search_tracks_page("mix", 10, 10)
+        assert [t["id"] for t in page] == list(range(10, 20)) and next_index == 20
+        assert music.search_tracks_page("mix", 20, 10)[1] is None
+        assert len(DeezerHandler.requests_seen) == 3
+    finally:
+        DeezerHandler.total = 30
+        server.shutdown()
+
+
+def test_music_page_loads_more(monkeypatch):
+    """The web page shows the first page; "Load more" fetches only the following one."""
+    from api.app import app
+
+    server = start_deezer(monkeypatch)
+    DeezerHandler.total = 20
+    try:
+        client = app.test_client()
+        html = client.get("/music?q=jazz").get_data(as_text=True)
+        assert html.count('class="card h-100"') == 12
+        assert "index=12" in html and "partial=1" in html
+
+        fragment = client.get("/music?q=jazz&index=12&partial=1").get_data(as_text=True)
+        assert "<html" not in fragment and fragment.count('class="card h-100"') == 8
+        assert "Jazz 19" in fragment and "Load more" not in fragment
+        assert [params["index"] for _path, params in DeezerHandler.requests_seen] == ["0", "12"]
+    finally:
+        DeezerHandler.total = 30
+        server.shutdown()
+
+
+def test_local_track_index_answers_repeat_and_related_searches(tmp_path, monkeypatch):
+    """Pages Deezer returned are served locally in its order; Deezer is only asked for what the index lacks."""
+    server = start_deezer(monkeypatch)
+    monkeypatch.setattr(music, "LOCAL_INDEX", True)
+    monkeypatch.setattr(track_index, "DB_PATH", tmp_path / "tracks.db")
+    monkeypatch.setattr(track_index, "_stats", {"local_hits": 0, "local_misses": 0, "evicted": 0})
+    DeezerHandler.total = 8
+    try:
+        assert music.search_tracks_page("Blue Monday", 0, 5)[1] == 5
+        music._search_cache.clear()
+
+        # Repeat search: the stored page, in Deezer's order, and more may follow
+        page, next_index = music.search_tracks_page("blue monday", 0, 5)
+        assert [t["id"] for t in page] == [0, 1, 2, 3, 4] and next_index == 5
+        assert len(DeezerHandler.requests_seen) == 1
+
+        # A full page with no last page seen yet doesn't end the results
+        daft_punk = [music._track_from_item(make_track(i, "daft punk")) for i in range(100, 112)]
+        track_index.add_tracks("daft punk", 0, daft_punk, 12)
+        page, next_index = track_index.search_page("daft punk", 0, 12)
+        assert [t["id"] for t in page] == list(range(100, 112)) and next_index == 12
+        assert track_index.search_page("daft punk", 12, 12) is None
+
+        # A page never fetched comes from Deezer, which reports the last page
+        assert [t["id"] for t in music.search_tracks_page("blue monday", 5, 5)[0]] == [5, 6, 7]
+        assert len(DeezerHandler.requests_seen) == 2
+        music._search_cache.clear()
+        # ... so the short last page is answered locally from now on
+        page, next_index = music.search_tracks_page("blue monday", 5, 5)
+        assert [t["id"] for t in page] == [5, 6, 7] and next_index is None
+        assert len(DeezerHandler.requests_seen) == 2
+
+        # A related single-page search may use any stored track (prefix match) ...
+        related = music.search_tracks("monda", limit=3)
+        assert len(related) == 3 and all("Monday" in t["name"] for t in related)
+        assert len(DeezerHandler.requests_seen) == 2
+        # ... but its pages come from Deezer, never mixed with local ranking
+        music.search_tracks_page("monda", 0, 3)
+        assert len(DeezerHandler.requests_seen) == 3
+        stats = music.get_search_cache_stats()
+        assert stats["local_hits"] == 4 and stats["local_tracks"] == 20
+
+        # Bounded: the least recently seen tracks go first, and their stored pages are asked of Deezer again
+        monkeypatch.setattr(track_index, "MAX_TRACKS", 20)
+        track_index.add_tracks("fresh", 0, [{"id": 200, "name": "Fresh Track"}], None)
+        assert track_index.stats()["local_tracks"] == 18
+        assert track_index.search_page("blue monday", 0, 5) is None
+        assert track_index.search_page("fresh", 0, 1) == ([{
+            "id": 200, "name": "Fresh Track", "artists": "", "album": "",
+            "image": None, "preview_url": None, "external_url": None,
+        }], None)
+    finally:
+        DeezerHandler.total = 30
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    # The tests use pytest fixtures (monkeypatch, tmp_path), so run the file through pytest
+    import pytest
+
+    sys.exit(pytest.main([__file__, "-q"]))
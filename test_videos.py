@@ -0,0 +1,712 @@
+"""
+Tests for the IPTV video module.
+Runs against a small in-memory catalog, so no network access is needed.
+"""
+import base64
+import io
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Ensure the project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from modules import catalog_store, stream_probe, video_index, videos
+from modules.singleflight import SingleFlight
+
+
+SAMPLE_CHANNELS = [
+    {"id": "CNN.us", "name": "CNN", "country": "US", "categories": ["news"]},
+    {"id": "CNNInt.us", "name": "CNN International", "country": "US", "categories": ["news"]},
+    {"id": "BBCOne.uk", "name": "BBC One", "country": "UK", "categories": ["general"]},
+    {"id": "BBCNews.uk", "name": "BBC News", "country": "UK", "categories": ["news"]},
+    {"id": "SkySports.uk", "name": "Sky Sports F1", "country": "UK", "categories": ["sports"]},
+    {"id": "TF1.fr", "name": "TF1", "country": "FR", "categories": ["general"]},
+    {"id": "France24.fr", "name": "France 24 (English)", "country": "FR", "categories": ["news"]},
+    {"id": "ABSCBN.ph", "name": "ABS-CBN", "country": "PH", "categories": ["general", "entertainment"]},
+    {"id": "GMA.ph", "name": "GMA Pinoy TV", "country": "PH", "categories": ["entertainment"]},
+    {"id": "NoStream.us", "name": "No Stream News", "country": "US", "categories": ["news"]},
+]
+
+SAMPLE_STREAMS = [
+    {"channel": c["id"], "url": f"http://streams.example/{c['id']}.m3u8"}
+    for c in SAMPLE_CHANNELS
+    if c["id"] != "NoStream.us"
+]
+
+SAMPLE_COUNTRIES = {"US": "United States", "UK": "United Kingdom", "FR": "France", "PH": "Philippines"}
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """Serves SAMPLE_CHANNELS with an ETag and honours If-None-Match."""
+
+    etag = '"v1"'
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(SAMPLE_CHANNELS).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    """Stand-in stream host: /ok answers fast, /slow after a delay, anything else 404s."""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.2)
+            status = 200 if self.path.startswith(("/ok", "/slow")) else 404
+            self.send_response(status)
+            self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+            self.send_header("Content-Length", "7")
+            self.end_headers()
+            self.wfile.write(b"#EXTM3U")
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(handler):
+    """Start a local HTTP server in a daemon thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def install_catalog(channels=SAMPLE_CHANNELS, streams=SAMPLE_STREAMS, countries=SAMPLE_COUNTRIES):
+    """Replace the module caches with an in-memory catalog."""
+    videos._channels_cache = video_index.channels_from_feed(channels)
+    videos._streams_cache = video_index.streams_from_feed(streams)
+    videos._countries_cache = dict(countries)
+    videos._channel_stream_map = None
+    videos._catalog = None
+    videos._result_cache.clear()
+
+
+def parse_feed(name, items):
+    """Run raw feed items through the feed's JSON parser, as a download would."""
+    if items is None:
+        return None
+    return videos._FEED_PARSERS[name](io.BytesIO(json.dumps(items).encode()))
+
+
+def scan_names(query):
+    """Reference implementation: plain substring scan over playable channels."""
+    q = query.lower().strip()
+    playable = {s["channel"] for s in SAMPLE_STREAMS}
+    return [c["id"] for c in SAMPLE_CHANNELS if c["id"] in playable and q in c["name"].lower()]
+
+
+def test_index_matches_substring_scan():
+    """Indexed search returns exactly what a full substring scan returns."""
+    install_catalog()
+    queries = ["cnn", "CNN ", "n", "bbc n", "c n", "s-c", "24 (eng", "f1", "sport", "zzz", "+", "tv", "ort"]
+    for query in queries:
+        ids = [v["id"] for v in videos.search_videos(query, max_results=100)]
+        assert ids == scan_names(query), query
+
+
+def test_index_respects_filters_and_limit():
+    """Filters and max_results still apply on top of the index."""
+    install_catalog()
+    ids = [v["id"] for v in videos.search_videos("news", max_results=100, country="UK")]
+    assert ids == ["BBCNews.uk"]
+    assert len(videos.search_videos("n", max_results=2)) == 2
+
+
+def test_facets_match_filter_semantics():
+    """Country (code or name) and category facets select the same channels as a scan."""
+    install_catalog()
+    playable = {s["channel"] for s in SAMPLE_STREAMS}
+
+    def scan(country, category):
+        ids = []
+        for c in SAMPLE_CHANNELS:
+            name = SAMPLE_COUNTRIES.get(c["country"], "").lower()
+            if c["id"] not in playable:
+                continue
+            if country and not (country == c["country"].lower() or (name and country in name)):
+                continue
+            if category and category not in c["categories"]:
+                continue
+            ids.append(c["id"])
+        return ids
+
+    for country in ["", "uk", "US", "united", "fran", "zz"]:
+        for category in ["", "news", "General", "entertainment", "none"]:
+            ids = [v["id"] for v in videos.search_videos("", 100, country=country or None, category=category or None)]
+            assert ids == scan(country.lower(), category.lower()), (country, category)
+
+
+def test_fuzzy_search_tolerates_typos():
+    """Trigram mode finds misspelled names and alt names, best match first."""
+    channels = SAMPLE_CHANNELS + [
+        {"id": "Kapamilya.ph", "name": "Kapamilya Channel", "alt_names": ["ABS-CBN Kapamilya"],
+         "country": "PH", "categories": ["general"]},
+    ]
+    streams = SAMPLE_STREAMS + [{"channel": "Kapamilya.ph", "url": "http://streams.example/kapamilya.m3u8"}]
+    install_catalog(channels, streams)
+
+    assert videos.search_videos("intrenational") == []
+    assert videos.search_videos("intrenational", fuzzy=True)[0]["id"] == "CNNInt.us"
+    assert videos.search_videos("bbc nwes", fuzzy=True)[0]["id"] == "BBCNews.uk"
+    assert "Kapamilya.ph" in [v["id"] for v in videos.search_videos("kapamilia", fuzzy=True)]
+    assert [v["id"] for v in videos.search_videos("bbc nwes", fuzzy=True, country="fr")] == []
+    # Non-fuzzy mode keeps substring semantics
+    assert [v["id"] for v in videos.search_videos("bbc")] == ["BBCOne.uk", "BBCNews.uk"]
+
+
+def test_filter_vocabularies_carry_counts():
+    """Countries and categories come with playable-channel counts from the catalog."""
+    install_catalog()
+    countries = {c["code"]: c["count"] for c in videos.get_available_countries()}
+    assert countries == {"US": 2, "UK": 3, "FR": 2, "PH": 2}  # NoStream.us has no stream
+    assert [c["code"] for c in videos.get_available_countries(by_popularity=True)][0] == "UK"
+
+    assert videos.get_available_categories() == ["entertainment", "general", "news", "sports"]
+    assert videos.get_available_categories(by_popularity=True)[0] == "news"
+    assert videos.get_category_counts()["news"] == 4
+    assert videos.get_available_categories(min_count=2) == ["entertainment", "general", "news"]
+
+
+def test_related_channels():
+    """Related channels favour similar names, shared categories and country; skip unplayable ones."""
+    install_catalog()
+    related = [v["id"] for v in videos.related_channels("CNN.us", 5)]
+    assert related[0] == "CNNInt.us"
+    assert "CNN.us" not in related and "NoStream.us" not in related
+    assert set(related[:3]) == {"CNNInt.us", "BBCNews.uk", "France24.fr"}  # news first
+    assert len(videos.related_channels("CNN.us", 2)) == 2
+    assert videos.related_channels("Unknown.xx") == []
+
+
+def test_get_channel_by_id():
+    """Any playable channel resolves by id without a search."""
+    install_catalog()
+    channel = videos.get_channel("GMA.ph")
+    assert channel["title"] == "GMA Pinoy TV" and channel["country"] == "Philippines"
+    assert channel == videos.search_videos("gma")[0]
+    assert videos.get_channel("NoStream.us") is None
+    assert videos.get_channel("Unknown.xx") is None
+
+
+def test_autocomplete_prefixes():
+    """Name prefixes come first, then later words; unplayable channels are never suggested."""
+    install_catalog()
+    titles = lambda prefix, k=8: [s["title"] for s in videos.autocomplete_channels(prefix, k)]
+    assert titles("bbc") == ["BBC News", "BBC One"]
+    assert titles("n") == ["BBC News"]  # "No Stream News" has no stream
+    assert titles("cnn ") == ["CNN International"]
+    assert titles("sp") == ["Sky Sports F1"]
+    assert titles("c", k=2) == ["CNN", "CNN International"]
+    assert titles("") == [] and titles("zzz") == []
+
+
+def test_m3u_playlist_export():
+    """The playlist streams every filtered match as EXTINF entries, gzipped on request."""
+    import gzip
+    from api.app import app
+
+    install_catalog()
+    lines = "".join(videos.iter_m3u(country="uk", batch_size=2)).splitlines()
+    assert lines[0] == "#EXTM3U"
+    assert lines[1] == (
+        '#EXTINF:-1 tvg-id="BBCOne.uk" tvg-name="BBC One" tvg-logo="" tvg-country="UK" '
+        'group-title="General",BBC One'
+    )
+    assert lines[2] == "http://streams.example/BBCOne.uk.m3u8"
+    assert [line.rsplit(",", 1)[1] for line in lines[1::2]] == ["BBC One", "BBC News", "Sky Sports F1"]
+
+    client = app.test_client()
+    plain = client.get("/api/videos/playlist.m3u8?category=news")
+    assert plain.mimetype == "application/vnd.apple.mpegurl" and plain.is_streamed
+    assert "Content-Encoding" not in plain.headers
+    body = plain.get_data(as_text=True)
+    assert body.count("#EXTINF") == len(videos.search_videos(category="news", max_results=100))
+
+    zipped = client.get("/api/videos/playlist.m3u8?category=news", headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped.get_data()).decode("utf-8") == body
+    assert client.get("/api/videos/playlist.txt").status_code == 404
+
+
+def test_pagination_walks_all_matches():
+    """Following next_cursor visits every match once, with a stable total."""
+    install_catalog()
+    expected = [v["id"] for v in videos.search_videos("", max_results=100)]
+
+    ids, cursor = [], None
+    while True:
+        page = videos.search_videos_page(cursor=cursor, page_size=4)
+        assert page["total"] == len(expected)
+        ids.extend(v["id"] for v in page["results"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == expected
+
+    page = videos.search_videos_page("cnn", page_size=1)
+    assert page["total"] == 2 and page["next_cursor"]
+    page = videos.search_videos_page("cnn", cursor=page["next_cursor"], page_size=1)
+    assert [v["id"] for v in page["results"]] == ["CNNInt.us"] and page["next_cursor"] is None
+
+    def crafted(payload):
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+    bad_cursors = ["not-a-cursor", crafted([-1, [1], 0, 5]), crafted([0, "CNN.us", "1", 5]),
+                   crafted([0, "CNN.us", 1, True]), crafted({"pos": 0})]
+    for bad in bad_cursors:
+        try:
+            videos.search_videos_page(cursor=bad)
+            assert False, f"expected ValueError for {bad}"
+        except ValueError:
+            pass
+
+    # The page falls back to the first page instead of failing
+    from api.app import app
+    response = app.test_client().get(f"/videos?cursor={bad_cursors[1]}")
+    assert response.status_code == 200
+    assert "<title>Videos</title>" in response.get_data(as_text=True)
+
+
+def test_stream_probe_and_best_stream(tmp_path, monkeypatch):
+    """Probes record liveness/latency per URL, respect per-host limits, and drive stream choice."""
+    monkeypatch.setattr(catalog_store, "SNAPSHOT_DIR", tmp_path)
+    monkeypatch.setattr(stream_probe, "_health", {})
+    server, base_url = start_server(StreamHandler)
+    try:
+        ok, slow, dead = f"{base_url}/ok.m3u8", f"{base_url}/slow.m3u8", f"{base_url}/dead.m3u8"
+        refused = "http://127.0.0.1:9/closed.m3u8"
+        results = stream_probe.probe_urls([ok, slow, dead, refused], timeout=2)
+        assert results[ok]["alive"] and results[slow]["alive"]
+        assert not results[dead]["alive"] and not results[refused]["alive"]
+        assert results[slow]["latency"] > results[ok]["latency"]
+        assert (tmp_path / "stream_health.json").exists()
+
+        # Another worker saved its own results meanwhile: they are merged, not overwritten
+        other = "http://other.example/live.m3u8"
+        saved = json.loads((tmp_path / "stream_health.json").read_text())
+        saved[other] = {"alive": True, "latency": 0.1, "checked_at": time.time()}
+        (tmp_path / "stream_health.json").write_text(json.dumps(saved))
+        stream_probe.probe_urls([ok], timeout=2)
+        saved = json.loads((tmp_path / "stream_health.json").read_text())
+        assert other in saved and saved[ok]["checked_at"] > results[ok]["checked_at"]
+        assert stream_probe.get_health(other)["alive"]
+
+        StreamHandler.max_in_flight = 0
+        stream_probe.probe_urls([f"{base_url}/slow/{i}" for i in range(6)], max_workers=6, per_host=2)
+        assert StreamHandler.max_in_flight <= 2
+
+        channels = [{"id": "Multi.us", "name": "Multi Stream", "country": "US", "categories": []}]
+        streams = [{"channel": "Multi.us", "url": url} for url in (dead, slow, ok)]
+        install_catalog(channels, streams)
+        assert videos.search_videos("multi")[0]["stream_url"] == ok
+    finally:
+        server.shutdown()
+
+
+def test_stream_probe_dispatches_per_host(tmp_path, monkeypatch):
+    """Streams clustered on one host don't starve other hosts, and results land as they come in."""
+    monkeypatch.setattr(catalog_store, "SNAPSHOT_DIR", tmp_path)
+    monkeypatch.setattr(stream_probe, "_health", {})
+    (server_a, host_a), (server_b, host_b) = start_server(StreamHandler), start_server(StreamHandler)
+    try:
+        # All of host A's streams come first, as they do when a CDN serves a whole country
+        urls = [f"{host_a}/slow/{i}" for i in range(10)] + [f"{host_b}/slow/{i}" for i in range(10)]
+        done = threading.Event()
+        started = time.perf_counter()
+        sweep = threading.Thread(target=lambda: (stream_probe.probe_urls(urls, max_workers=4, per_host=2), done.set()))
+        sweep.start()
+        time.sleep(0.3)
+        # Both hosts are being probed from the start, and finished probes are already visible
+        assert any(stream_probe.get_health(u) for u in urls[:10])
+        assert any(stream_probe.get_health(u) for u in urls[10:])
+        sweep.join()
+        # 2 probes per host in parallel: 5 rounds of 0.2s, not host A then host B
+        assert done.is_set() and time.perf_counter() - started < 1.5
+        assert all(stream_probe.get_health(u)["alive"] for u in urls)
+    finally:
+        server_a.shutdown()
+        server_b.shutdown()
+
+
+def test_concurrent_first_requests_load_once(monkeypatch):
+    """Concurrent cold searches share one download per feed."""
+    feeds = {"channels": SAMPLE_CHANNELS, "streams": SAMPLE_STREAMS,
+             "countries": [{"code": k, "name": v} for k, v in SAMPLE_COUNTRIES.items()]}
+    calls = {name: 0 for name in feeds}
+
+    def slow_fetch(name, url):
+        calls[name] += 1
+        time.sleep(0.2)
+        return parse_feed(name, feeds[name])
+
+    install_catalog()
+    videos._channels_cache = videos._streams_cache = videos._countries_cache = None
+    monkeypatch.setattr(videos, "_fetch_feed", slow_fetch)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(len(videos.search_videos("", 100)))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == {"channels": 1, "streams": 1, "countries": 1}
+    assert results == [len(SAMPLE_STREAMS)] * 8
+
+
+def test_singleflight_wait_is_bounded():
+    """Waiters give up after their timeout while the leader keeps going."""
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do("k", lambda: release.wait(2) and "done"))
+    leader.start()
+    time.sleep(0.05)
+    try:
+        flight.do("k", lambda: "not me", timeout=0.1)
+        assert False, "expected TimeoutError"
+    except TimeoutError:
+        pass
+    release.set()
+    leader.join()
+    assert flight.in_flight() == 0 and flight.do("k", lambda: "again") == "again"
+
+
+def test_refresh_swaps_in_new_catalog(monkeypatch):
+    """A refresh builds a new catalog version; the old one stays intact for in-flight readers."""
+    install_catalog()
+    old = videos._get_catalog()
+    new_channels = SAMPLE_CHANNELS + [{"id": "Fresh.us", "name": "Fresh News", "country": "US", "categories": ["news"]}]
+    new_streams = SAMPLE_STREAMS + [{"channel": "Fresh.us", "url": "http://streams.example/fresh.m3u8"}]
+    upstream = {"channels": new_channels, "streams": new_streams, "countries": None}
+    monkeypatch.setattr(catalog_store, "fetch", lambda name, url, meta=None, timeout=30, parse=None: parse_feed(name, upstream[name]))
+
+    assert videos.refresh_catalog() is True
+    current = videos._get_catalog()
+    assert current is not old and current.version == old.version + 1
+    assert [v["id"] for v in videos.search_videos("fresh")] == ["Fresh.us"]
+    assert "Fresh.us" not in {c.id for c in old.channels}
+    assert current.countries is old.countries  # unchanged feed reused
+
+    upstream.update(channels=None, streams=None)
+    assert videos.refresh_catalog() is False
+    assert videos._get_catalog() is current
+
+
+def test_refresh_patches_catalog_incrementally(monkeypatch):
+    """A refresh re-indexes only the changed channels and searches like a full rebuild."""
+    install_catalog()
+    old = videos._get_catalog()
+    new_channels = [c for c in SAMPLE_CHANNELS if c["id"] not in ("TF1.fr", "SkySports.uk")] + [
+        {"id": "Fresh.us", "name": "Fresh News", "country": "US", "categories": ["news"]}
+    ]
+    new_channels[0] = dict(new_channels[0], name="CNN Headline", categories=["business"])
+    new_streams = [s for s in SAMPLE_STREAMS if s["channel"] != "BBCOne.uk"] + [
+        {"channel": "Fresh.us", "url": "http://streams.example/fresh.m3u8"},
+        {"channel": "NoStream.us", "url": "http://streams.example/nostream.m3u8"},
+    ]
+    upstream = {"channels": new_channels, "streams": new_streams, "countries": None}
+    monkeypatch.setattr(catalog_store, "fetch", lambda name, url, meta=None, timeout=30, parse=None: parse_feed(name, upstream[name]))
+
+    assert videos.refresh_catalog() is True
+    patched = videos._get_catalog()
+    full = video_index.Catalog(
+        video_index.channels_from_feed(new_channels),
+        videos._group_streams(video_index.streams_from_feed(new_streams)),
+        SAMPLE_COUNTRIES,
+        patched.version,
+    )
+    # Unchanged channels keep their positions; the new one is appended
+    assert patched.positions_by_id["BBCNews.uk"] == old.positions_by_id["BBCNews.uk"]
+    assert patched.positions_by_id["Fresh.us"] == len(old.channels)
+    assert "TF1.fr" not in patched.positions_by_id
+
+    def ids(catalog, positions):
+        return sorted(catalog.channels[pos].id for pos in positions)
+
+    assert ids(patched, patched.playable) == ids(full, full.playable)
+    for query in ("news", "cnn", "tf1", "bbc", "fresh"):
+        assert ids(patched, patched.tokens.candidates(query)) == ids(full, full.tokens.candidates(query))
+        assert ids(patched, patched.prefixes.complete(query, 20)) == ids(full, full.prefixes.complete(query, 20))
+        assert ids(patched, (p for p, _ in patched.trigrams.search(query))) == ids(full, (p for p, _ in full.trigrams.search(query)))
+    for category in ("news", "business", "general"):
+        assert ids(patched, patched.facets.category_positions(category)) == ids(full, full.facets.category_positions(category))
+        assert patched.category_counts[category] == full.category_counts[category]
+    assert patched.country_counts == full.country_counts
+    # "sports" went with Sky Sports; "general" stays listed for the now unplayable BBC One
+    assert patched.category_counts == full.category_counts and "sports" not in patched.category_counts
+    assert [v["id"] for v in videos.search_videos("news")] == ["BBCNews.uk", "NoStream.us", "Fresh.us"]
+
+    # The previous version is left as it was for in-flight readers
+    assert [old.channels[p].name for p in old.tokens.candidates("cnn")] == ["CNN", "CNN International"]
+    assert old.positions_by_id["BBCOne.uk"] in old.playable
+
+
+def test_repeated_renames_force_a_full_rebuild():
+    """Dead names left by renamed channels count toward the rebuild threshold, like dead slots."""
+    streams_map = videos._group_streams(video_index.streams_from_feed(SAMPLE_STREAMS))
+    catalog = video_index.Catalog(video_index.channels_from_feed(SAMPLE_CHANNELS), streams_map, SAMPLE_COUNTRIES, 1)
+    for version in range(2, 100):
+        renamed = [dict(SAMPLE_CHANNELS[0], name=f"Renamed {version}")] + SAMPLE_CHANNELS[1:]
+        patched = catalog.patched(video_index.channels_from_feed(renamed), streams_map, SAMPLE_COUNTRIES, version)
+        if patched is None:
+            break
+        catalog = patched[0]
+        assert catalog.trigrams.dead_share() <= video_index._MAX_DEAD_SHARE
+        assert catalog.tokens.dead_share() <= video_index._MAX_DEAD_SHARE
+    else:
+        raise AssertionError("renames never triggered a full rebuild")
+    assert len(catalog.channels) == len(SAMPLE_CHANNELS)
+
+
+def test_concurrent_feed_updates_are_not_lost(monkeypatch):
+    """Channels and streams revalidated at the same time both end up in the catalog."""
+    install_catalog()
+    videos._get_catalog()
+    monkeypatch.setattr(videos, "PROBE_STREAMS", False)
+    install = videos._install_catalog
+
+    def slow_install(*args, **kwargs):
+        time.sleep(0.1)  # widen the window between reading and writing the caches
+        return install(*args, **kwargs)
+
+    monkeypatch.setattr(videos, "_install_catalog", slow_install)
+    new_channels = SAMPLE_CHANNELS + [{"id": "New.us", "name": "New Channel", "country": "US"}]
+    new_streams = SAMPLE_STREAMS + [{"channel": "New.us", "url": "http://streams.example/new.m3u8"}]
+    updates = [{"channels": parse_feed("channels", new_channels)}, {"streams": parse_feed("streams", new_streams)}]
+    threads = [threading.Thread(target=videos._apply_feed_changes, args=(u,)) for u in updates]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert videos.get_channel("New.us")["stream_url"] == "http://streams.example/new.m3u8"
+    assert len(videos._streams_cache) == len(new_streams)
+    assert len(videos._channels_cache) == len(new_channels)
+
+
+def test_feed_update_during_first_build_is_applied(monkeypatch):
+    """A snapshot revalidation that lands while the first catalog is built patches it afterwards."""
+    install_catalog()
+    monkeypatch.setattr(videos, "PROBE_STREAMS", False)
+    new_channels = SAMPLE_CHANNELS + [{"id": "New.us", "name": "New Channel", "country": "US"}]
+    new_streams = SAMPLE_STREAMS + [{"channel": "New.us", "url": "http://streams.example/new.m3u8"}]
+    videos._streams_cache = video_index.streams_from_feed(new_streams)
+    install = videos._install_catalog
+    revalidations = []
+
+    def slow_install(*args, **kwargs):
+        if not revalidations:
+            update = {"channels": parse_feed("channels", new_channels)}
+            revalidations.append(threading.Thread(target=videos._apply_feed_changes, args=(update,)))
+            revalidations[0].start()
+            time.sleep(0.2)  # the revalidation finishes while the index is built
+        return install(*args, **kwargs)
+
+    monkeypatch.setattr(videos, "_install_catalog", slow_install)
+    assert "New.us" not in videos._get_catalog().positions_by_id
+    revalidations[0].join()
+    assert videos.get_channel("New.us")["stream_url"] == "http://streams.example/new.m3u8"
+
+
+def test_result_cache_hits_and_invalidation():
+    """Repeat searches are served from the LRU cache until the catalog changes."""
+    install_catalog()
+    before = videos.get_search_cache_stats()
+    first = videos.search_videos_page(" CNN ", country="us")
+    again = videos.search_videos_page("cnn", country="US")
+    stats = videos.get_search_cache_stats()
+    assert again == first
+    assert stats["hits"] == before["hits"] + 1 and stats["misses"] == before["misses"] + 1
+
+    again["results"].clear()  # callers can't corrupt the cached page
+    assert videos.search_videos_page("cnn", country="US") == first
+
+    catalog = videos._get_catalog()
+    videos._install_catalog(catalog.channels, catalog.streams_map, catalog.countries)
+    assert videos.get_search_cache_stats()["size"] == 0
+
+
+def test_cached_results_follow_probe_results(monkeypatch):
+    """A cached page switches to the live stream once the prober finds the first one dead."""
+    dead, live = "http://streams.example/dead.m3u8", "http://streams.example/live.m3u8"
+    monkeypatch.setattr(stream_probe, "_health", {})
+    monkeypatch.setattr(videos, "PROBE_STREAMS", False)
+    streams = [s for s in SAMPLE_STREAMS if s["channel"] != "CNN.us"]
+    install_catalog(streams=streams + [{"channel": "CNN.us", "url": dead}, {"channel": "CNN.us", "url": live}])
+
+    first = videos.search_videos_page("cnn", page_size=1)["results"][0]
+    assert first["stream_url"] == dead
+    assert videos.search_videos("cnn", 1)[0]["stream_url"] == dead
+
+    now = time.time()
+    stream_probe._health.update({
+        dead: {"alive": False, "latency": None, "checked_at": now},
+        live: {"alive": True, "latency": 0.1, "checked_at": now},
+    })
+    before = videos.get_search_cache_stats()["hits"]
+    assert videos.search_videos_page("cnn", page_size=1)["results"][0]["stream_url"] == live
+    assert videos.search_videos("cnn", 1)[0]["stream_url"] == live
+    assert videos.get_search_cache_stats()["hits"] == before + 2
+
+
+def test_snapshot_conditional_revalidation(tmp_path, monkeypatch):
+    """A fetched feed is persisted and revalidated with If-None-Match."""
+    monkeypatch.setattr(catalog_store, "SNAPSHOT_DIR", tmp_path)
+    server, base_url = start_server(FeedHandler)
+    try:
+        data = catalog_store.fetch("channels", f"{base_url}/channels.json")
+        assert data == SAMPLE_CHANNELS
+
+        snapshot = catalog_store.read_snapshot("channels")
+        assert snapshot is not None
+        cached, meta = snapshot
+        assert cached == SAMPLE_CHANNELS and meta["etag"] == '"v1"'
+
+        # Unchanged upstream: 304, nothing to reload
+        assert catalog_store.fetch("channels", f"{base_url}/channels.json", meta) is None
+        assert FeedHandler.requests_seen[-1].get("If-None-Match") == '"v1"'
+    finally:
+        server.shutdown()
+
+
+def test_feed_json_parsed_incrementally():
+    """Feeds parse item by item across chunk boundaries into the same records."""
+    body = json.dumps(SAMPLE_STREAMS + [{"channel": "X.us", "url": "http://x", "quality": 720}], indent=1).encode()
+    for chunk_size in (1, 7, 1 << 16):
+        items = list(video_index.iter_json_array(io.BytesIO(b"\xef\xbb\xbf" + body), chunk_size))
+        assert items == json.loads(body)
+    assert list(video_index.iter_json_array(io.BytesIO(b" [ ] "))) == []
+
+    expected = [(s.channel, s.url) for s in video_index.streams_from_feed(SAMPLE_STREAMS)]
+    parsed = video_index.streams_from_json(io.BytesIO(json.dumps(SAMPLE_STREAMS).encode()))
+    assert [(s.channel, s.url) for s in parsed] == expected
+
+    for bad in (b'{"a": 1}', b'[{"a": 1}', b'[{"a": 1},]', b'[1 2]', b'[1] x'):
+        try:
+            list(video_index.iter_json_array(io.BytesIO(bad), 2))
+            assert False, bad
+        except ValueError:
+            pass
+
+
+def test_shared_catalog_file(tmp_path, monkeypatch):
+    """Workers map one catalog file and search it exactly like the in-memory catalog."""
+    from modules import catalog_file
+
+    def snapshot():
+        return (
+            [v["id"] for v in videos.search_videos("n", 100)],
+            [v["id"] for v in videos.search_videos("", 100, country="united", category="news")],
+            [v["id"] for v in videos.search_videos("bbc nwes", fuzzy=True)],
+            videos.search_videos_page("", page_size=3),
+            videos.autocomplete_channels("bbc"),
+            videos.get_channel("GMA.ph"),
+            [v["id"] for v in videos.related_channels("CNN.us")],
+            videos.get_available_countries(min_count=1),
+            videos.get_available_categories(by_popularity=True),
+        )
+
+    install_catalog()
+    expected = snapshot()
+
+    monkeypatch.setattr(catalog_store, "SNAPSHOT_DIR", tmp_path)
+    monkeypatch.setattr(videos, "SHARED_CATALOG", True)
+    install_catalog()
+    built = videos._get_catalog()
+    assert isinstance(built, catalog_file.MappedCatalog)
+    assert (tmp_path / "catalog.bin").exists()
+    assert videos._channels_cache is None  # parsed feeds released once the file is mapped
+    assert snapshot() == expected
+
+    # Another worker maps the file without touching the feeds
+    def no_fetch(*args, **kwargs):
+        raise AssertionError("feeds should not be loaded")
+
+    monkeypatch.setattr(catalog_store, "fetch", no_fetch)
+    install_catalog()
+    videos._channels_cache = videos._streams_cache = videos._countries_cache = None
+    worker = videos._get_catalog()
+    assert isinstance(worker, catalog_file.MappedCatalog) and worker is not built
+    assert snapshot() == expected
+
+    # A file replaced by another worker is picked up on the next check
+    fresh = video_index.Catalog(
+        video_index.channels_from_feed(SAMPLE_CHANNELS + [{"id": "Fresh.us", "name": "Fresh News", "country": "US"}]),
+        videos._group_streams(video_index.streams_from_feed(
+            SAMPLE_STREAMS + [{"channel": "Fresh.us", "url": "http://streams.example/fresh.m3u8"}]
+        )),
+        SAMPLE_COUNTRIES,
+        1,
+    )
+    time.sleep(0.01)
+    catalog_file.write_catalog(tmp_path / "catalog.bin", fresh, videos._feed_sources())
+    videos._shared_checked_at = 0.0
+    assert videos._get_catalog() is not worker
+    assert [v["id"] for v in videos.search_videos("fresh")] == ["Fresh.us"]
+
+    # A file built from other snapshots is ignored
+    assert catalog_file.open_catalog(tmp_path / "catalog.bin", 1, {"channels": ["other", 0]}) is None
+
+
+def test_catalog_feeds_load_concurrently(monkeypatch):
+    """The three feeds download in parallel and a failing feed doesn't block the rest."""
+    feeds = {"channels": SAMPLE_CHANNELS, "streams": SAMPLE_STREAMS,
+             "countries": [{"code": k, "name": v} for k, v in SAMPLE_COUNTRIES.items()]}
+
+    def slow_fetch(name, url):
+        time.sleep(0.3)
+        if name == "countries":
+            raise OSError("countries feed down")
+        return parse_feed(name, feeds[name])
+
+    install_catalog()
+    videos._channels_cache = videos._streams_cache = videos._countries_cache = None
+    monkeypatch.setattr(videos, "_fetch_feed", slow_fetch)
+
+    started = time.perf_counter()
+    channels, streams_map, countries = videos._load_catalog()
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.75, elapsed
+    assert len(channels) == len(SAMPLE_CHANNELS)
+    assert len(streams_map) == len(SAMPLE_STREAMS)
+    assert countries == {}
+    assert videos._countries_cache is None  # retried on the next call
+
+
+if __name__ == "__main__":
+    # Most tests use pytest fixtures (monkeypatch, tmp_path), so run the file through pytest
+    import pytest
+
+    sys.exit(pytest.main([__file__, "-q"]))